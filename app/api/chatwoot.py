@@ -1,21 +1,199 @@
 """Chatwoot API endpoints with SQLAlchemy 2 and Pydantic v2 integration."""
 
+import asyncio
+import contextlib
+import functools
 import logging
-from typing import Any, Dict, List, Optional
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Dict, List, Optional
 
 import httpx
+import orjson
 from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app import config
 from app.db.session import get_session
-from app.models import Conversation, ConversationCreate, ConversationResponse
+from app.models import (
+    Conversation,
+    ConversationCreate,
+    ConversationPriorityValue,
+    ConversationResponse,
+    ConversationStatusValue,
+)
 from app.utils import handle_api_errors
+from app.utils.event_loop import run_async
+from app.utils.http import SSL_CONTEXT, LoopBoundClient, dump_json, load_json
 
 logger = logging.getLogger(__name__)
 
 
+def _json_or_empty(response: httpx.Response) -> Dict[str, Any]:
+    """Parse a JSON body, treating empty or malformed bodies as {}."""
+    if response.content and len(response.content.strip()) > 0:
+        try:
+            return load_json(response)
+        except Exception as json_err:
+            logger.warning("Failed to parse JSON response: %s", json_err)
+    return {}
+
+
+def _log_failures(op: str):
+    """Log and re-raise Chatwoot API failures of the decorated handler coroutine."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            try:
+                return await fn(self, *args, **kwargs)
+            except httpx.HTTPStatusError as e:
+                # No exc_info: the caller gets the exception, and formatting tracebacks is costly in an outage
+                logger.error("Chatwoot %s failed: url=%s status=%s", op, e.request.url, e.response.status_code)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Chatwoot %s response body: %s", op, e.response.text)
+                raise
+            except Exception as e:
+                logger.error("Chatwoot %s failed: %s", op, e)
+                raise
+
+        return wrapper
+
+    return decorator
+
+
+# Statuses Chatwoot (or its proxy) uses to shed load; the request was not processed and can be retried
+_OVERLOAD_STATUSES = frozenset({429, 503})
+_RETRY_BASE_DELAY = 0.5
+_RETRY_MAX_DELAY = 30.0
+
+
+class _AdaptiveLimiter:
+    """Concurrency limit that adapts like TCP congestion control (AIMD).
+
+    Every success raises the limit by 1/limit, up to max_limit; every overload response halves it.
+    Callers beyond the current limit wait for a slot, so a rate-limit burst slows the request rate
+    down instead of multiplying failures.
+    """
+
+    def __init__(self, max_limit: int):
+        self.max_limit = max(1, max_limit)
+        self.limit = float(self.max_limit)
+        self._active = 0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    async def acquire(self) -> None:
+        while self._active >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # Hand the slot this waiter was woken for to the next one
+                    self._wake()
+                raise
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+        self._active += 1
+
+    def release(self, overloaded: bool = False) -> None:
+        self._active -= 1
+        if overloaded:
+            self.limit = max(1.0, self.limit / 2)
+        else:
+            self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+        self._wake()
+
+    def _wake(self) -> None:
+        free = int(self.limit) - self._active
+        while free > 0 and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+
+def _retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying an overload response: Retry-After if given, else jittered backoff."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), _RETRY_MAX_DELAY)
+        except ValueError:
+            pass  # HTTP-date form; fall back to backoff
+    return min(_RETRY_BASE_DELAY * 2**attempt, _RETRY_MAX_DELAY) * random.uniform(0.5, 1.0)
+
+
+def _chatwoot_call(op: str, per_conversation: bool = False):
+    """Run the decorated handler coroutine under the handler's adaptive limiter.
+
+    429/503 responses shrink the limit and are retried up to CHATWOOT_OVERLOAD_RETRIES times;
+    other failures, and overloads that outlast the retries, are logged and re-raised.
+    With per_conversation, calls for the same conversation (the first argument) run one at a time.
+    """
+
+    def decorator(fn):
+        async def call(self, *args, **kwargs):
+            limiter: _AdaptiveLimiter = self._limiter
+            attempt = 0
+            while True:
+                await limiter.acquire()
+                overloaded = False
+                try:
+                    return await fn(self, *args, **kwargs)
+                except httpx.HTTPStatusError as e:
+                    overloaded = e.response.status_code in _OVERLOAD_STATUSES
+                    if not overloaded or attempt >= config.CHATWOOT_OVERLOAD_RETRIES:
+                        raise
+                    delay = _retry_delay(e.response, attempt)
+                finally:
+                    limiter.release(overloaded)
+                attempt += 1
+                logger.warning("Chatwoot %s overloaded, retrying in %.2fs (attempt %d)", op, delay, attempt)
+                await asyncio.sleep(delay)
+
+        if per_conversation:
+            # The lock is taken before a limiter slot, so queued same-conversation calls don't hold slots
+            @functools.wraps(fn)
+            async def wrapper(self, conversation_id, *args, **kwargs):
+                async with self._conversation_lock(conversation_id):
+                    return await call(self, conversation_id, *args, **kwargs)
+
+        else:
+            wrapper = functools.wraps(fn)(call)
+
+        return _log_failures(op)(wrapper)
+
+    return decorator
+
+
+# Upper bound on concurrent requests issued by the bulk helpers
+_BULK_CONCURRENCY = 8
+
+# Chatwoot returns 25 conversations per page; the meta block carries a count per assignee filter
+_CONVERSATIONS_PAGE_SIZE = 25
+_ASSIGNEE_TYPE_COUNT_KEYS = {
+    "me": "mine_count",
+    "unassigned": "unassigned_count",
+    "assigned": "assigned_count",
+    "all": "all_count",
+}
+
+# How long the team name -> id map is reused before get_teams is called again
+_TEAM_MAP_TTL = 60.0
+
+# How long a fetched team list is served by get_teams before asking Chatwoot again
+_TEAMS_TTL = 300.0
+
+# Conversations whose last successfully sent custom attributes are remembered
+_CUSTOM_ATTRIBUTES_CACHE_SIZE = 1024
+
+
 # Create router for Chatwoot API endpoints
 router = APIRouter(prefix="/chatwoot", tags=["chatwoot"])
 
@@ -27,52 +205,111 @@ class ChatwootHandler:
         api_key: str | None = None,
         account_id: str | None = None,
         admin_api_key: str | None = None,
+        send_batch_window_ms: int | None = None,
     ):
         self.api_url = api_url or config.CHATWOOT_API_URL
         self.account_id = account_id or config.CHATWOOT_ACCOUNT_ID
         self.api_key = api_key or config.CHATWOOT_API_KEY
         self.admin_api_key = admin_api_key or config.CHATWOOT_ADMIN_API_KEY
-        self.headers = {
-            "api_access_token": self.api_key,
-            "Content-Type": "application/json",
-        }
-        self.admin_headers = {
-            "api_access_token": self.admin_api_key,
-            "Content-Type": "application/json",
-        }
-        # Base URLs
+        # Built once as httpx.Headers so per-request merging copies them instead of re-normalizing a dict.
+        # self.headers are the async client's defaults; only admin and sync calls pass headers explicitly.
+        self.headers = httpx.Headers(
+            {
+                "api_access_token": self.api_key,
+                "Content-Type": "application/json",
+            }
+        )
+        self.admin_headers = httpx.Headers(
+            {
+                "api_access_token": self.admin_api_key,
+                "Content-Type": "application/json",
+            }
+        )
+        # Base URL of the shared client; methods pass paths relative to it
         self.account_url = f"{self.api_url}/accounts/{self.account_id}"
-        self.conversations_url = f"{self.account_url}/conversations"
+        # Shared client so keep-alive connections are reused across calls; HTTP/2 multiplexes
+        # the burst of calls a single webhook makes over one connection. Built lazily per event loop,
+        # since the module-level instance is created at import time.
+        self._clients = LoopBoundClient(
+            lambda: httpx.AsyncClient(
+                base_url=self.account_url,
+                headers=self.headers,
+                verify=SSL_CONTEXT,
+                http2=True,
+                timeout=30.0,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=60),
+            )
+        )
+        # Pending public replies per conversation, drained by one flush task each
+        if send_batch_window_ms is None:
+            send_batch_window_ms = config.CHATWOOT_SEND_BATCH_WINDOW_MS
+        self._send_batch_window = send_batch_window_ms / 1000
+        self._send_queues: dict[int, asyncio.Queue] = {}
+        self._flush_tasks: dict[int, asyncio.Task] = {}
+        # (monotonic timestamp, lowercase team name -> team id)
+        self._team_map_cache: tuple[float, dict[str, int]] | None = None
+        # (monotonic timestamp, teams) from the last successful get_teams
+        self._teams_cache: tuple[float, List[Dict[str, Any]]] | None = None
+        # conversation id -> canonical JSON of the custom attributes last sent, in LRU order
+        self._sent_custom_attributes: OrderedDict[int, bytes] = OrderedDict()
+        # Shared by every decorated API call; see _chatwoot_call
+        self._limiter = _AdaptiveLimiter(config.CHATWOOT_MAX_CONCURRENCY)
+        # conversation id -> (lock, holders and waiters); entries are dropped once unused
+        self._conversation_locks: dict[int, list] = {}
+
+    @property
+    def _client(self) -> httpx.AsyncClient:
+        return self._clients.get()
+
+    @_client.setter
+    def _client(self, client: httpx.AsyncClient) -> None:
+        self._clients.set(client)
+
+    async def aclose(self) -> None:
+        """Flush batched messages, then close the shared HTTP client and release pooled connections."""
+        await self.flush_pending()
+        await self._clients.aclose()
+
+    async def __aenter__(self) -> "ChatwootHandler":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    @contextlib.asynccontextmanager
+    async def _conversation_lock(self, conversation_id: int):
+        """Serialize mutations of one conversation while other conversations proceed in parallel."""
+        entry = self._conversation_locks.get(conversation_id)
+        if entry is None:
+            entry = self._conversation_locks[conversation_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._conversation_locks[conversation_id]
 
     async def get_conversation_messages(self, conversation_id: int) -> List[Dict[str, Any]]:
         """Get all messages for a specific conversation."""
-        url = f"{self.conversations_url}/{conversation_id}/messages"
+        url = f"/conversations/{conversation_id}/messages"
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.headers)
-                response.raise_for_status()
-                # The messages are in the 'payload' key
-                return response.json().get("payload", [])
+            response = await self._client.get(url)
+            response.raise_for_status()
+            # The messages are in the 'payload' key
+            return load_json(response).get("payload", [])
         except Exception as e:
-            logger.error(f"Failed to get messages for conversation {conversation_id}: {e}")
+            logger.error("Failed to get messages for conversation %s: %s", conversation_id, e)
             return []
 
     def send_message_sync(self, conversation_id: int, message: str, private: bool = False):
-        """Synchronous version of send_message for use in Celery tasks"""
-        import httpx
+        """Synchronous version of send_message for use in Celery tasks
 
-        url = f"{self.conversations_url}/{conversation_id}/messages"
-
-        data = {
-            "content": message,
-            "message_type": "outgoing",
-            "private": private,
-        }
-
-        with httpx.Client() as client:
-            response = client.post(url, json=data, headers=self.headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
+        Runs on the process's persistent event loop, so it shares the async client's connection
+        pool; it posts immediately and never joins a send batch.
+        """
+        return run_async(self._post_message(conversation_id, message, private=private))
 
     async def send_message(
         self,
@@ -82,8 +319,62 @@ class ChatwootHandler:
         attachments: List[str] | None = None,
         content_attributes: Dict[str, Any] | None = None,
     ) -> Dict[str, Any]:
-        """Send a message or private note to a conversation with rich content support"""
-        url = f"{self.conversations_url}/{conversation_id}/messages"
+        """Send a message or private note to a conversation with rich content support
+
+        With a send batch window configured, plain public messages are joined with other
+        messages for the same conversation that arrive within the window and posted once.
+        Every caller in a batch gets the response of the combined message.
+        """
+        if self._send_batch_window <= 0 or private or attachments or content_attributes:
+            return await self._post_message(conversation_id, message, private, attachments, content_attributes)
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self._send_queues.setdefault(conversation_id, asyncio.Queue())
+        queue.put_nowait((message, future))
+        if conversation_id not in self._flush_tasks:
+            self._flush_tasks[conversation_id] = asyncio.create_task(self._flush_loop(conversation_id))
+        return await future
+
+    async def _flush_loop(self, conversation_id: int) -> None:
+        queue = self._send_queues[conversation_id]
+        while True:
+            batch = [await queue.get()]
+            await asyncio.sleep(self._send_batch_window)
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+
+            try:
+                result = await self._post_message(conversation_id, "\n\n".join(message for message, _ in batch))
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(result)
+
+            # No await between the check and the cleanup, so send_message can't enqueue in between
+            if queue.empty():
+                del self._send_queues[conversation_id]
+                del self._flush_tasks[conversation_id]
+                return
+
+    async def flush_pending(self) -> None:
+        """Wait until every batched message has been posted."""
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks.values(), return_exceptions=True)
+
+    @_chatwoot_call("send_message")
+    async def _post_message(
+        self,
+        conversation_id: int,
+        message: str,
+        private: bool = False,
+        attachments: List[str] | None = None,
+        content_attributes: Dict[str, Any] | None = None,
+    ) -> Dict[str, Any]:
+        url = f"/conversations/{conversation_id}/messages"
         data = {
             "content": message,
             "message_type": "outgoing",
@@ -94,138 +385,135 @@ class ChatwootHandler:
         if attachments:
             data["attachments"] = [{"url": url} for url in attachments]
 
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data, headers=self.headers)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Failed to send message to conversation {conversation_id}: {e}")
-            raise
+        response = await self._client.post(url, content=dump_json(data))
+        response.raise_for_status()
+        return load_json(response)
 
-    async def add_labels(self, conversation_id: int, labels: List[str]) -> Dict[str, Any]:
-        """Add labels to a conversation"""
-        url = f"{self.conversations_url}/{conversation_id}/labels"
-
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json={"labels": labels}, headers=self.headers)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Failed to add labels to conversation {conversation_id}: {e}")
-            raise
+    async def _post(self, url: str, data: Any) -> httpx.Response:
+        """POST a JSON body.
 
+        The response body is always read, even when the caller won't parse it: closing an unread
+        HTTP/1.1 response drops its connection instead of returning it to the pool.
+        """
+        return await self._client.post(url, content=dump_json(data))
+
+    @_chatwoot_call("add_labels", per_conversation=True)
+    async def add_labels(
+        self, conversation_id: int, labels: List[str], parse_response: bool = True
+    ) -> Dict[str, Any] | None:
+        """Add labels to a conversation. Pass parse_response=False to skip decoding the reply."""
+        url = f"/conversations/{conversation_id}/labels"
+        response = await self._post(url, {"labels": labels})
+        response.raise_for_status()
+        return load_json(response) if parse_response else None
+
+    @_chatwoot_call("toggle_typing_status")
+    async def toggle_typing_status(self, conversation_id: int, typing_on: bool) -> None:
+        """Show or hide the typing indicator for the bot in a conversation."""
+        url = f"/conversations/{conversation_id}/toggle_typing_status"
+        response = await self._post(url, {"typing_status": "on" if typing_on else "off"})
+        response.raise_for_status()
+
+    @_chatwoot_call("get_conversation_data")
     async def get_conversation_data(self, conversation_id: int) -> Dict[str, Any]:
         """Get conversation data including custom attributes and labels"""
-        url = f"{self.conversations_url}/{conversation_id}"
-
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.admin_headers)
-                response.raise_for_status()
-                return response.json()
-        except httpx.HTTPStatusError as e:
-            logger.error(
-                f"Get conversation failed for {conversation_id}:\n"
-                f"URL: {url}\nStatus: {e.response.status_code}\n"
-                f"Response: {e.response.text}",
-                exc_info=True,
-            )
-            raise
-
-    async def assign_conversation(self, conversation_id: int, assignee_id: int) -> Dict[str, Any]:
-        """Assign a conversation to an agent."""
-        url = f"{self.conversations_url}/{conversation_id}/assignments"
+        url = f"/conversations/{conversation_id}"
+        response = await self._client.get(url, headers=self.admin_headers)
+        response.raise_for_status()
+        return load_json(response)
+
+    @_chatwoot_call("assign_conversation", per_conversation=True)
+    async def assign_conversation(
+        self, conversation_id: int, assignee_id: int, parse_response: bool = True
+    ) -> Dict[str, Any] | None:
+        """Assign a conversation to an agent. Pass parse_response=False to skip decoding the reply."""
+        url = f"/conversations/{conversation_id}/assignments"
         data = {"assignee_id": assignee_id}
+        response = await self._post(url, data)
+        response.raise_for_status()
+        return load_json(response) if parse_response else None
 
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data, headers=self.headers)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Failed to assign conversation {conversation_id} to agent {assignee_id}: {e}")
-            raise
-
+    @_chatwoot_call("update_custom_attributes", per_conversation=True)
     async def update_custom_attributes(self, conversation_id: int, custom_attributes: Dict[str, Any]) -> Dict[str, Any]:
-        """Update custom attributes for a conversation using the provided account_id and conversation_id."""
-        custom_attrs_url = f"{self.conversations_url}/{conversation_id}/custom_attributes"
-
-        try:
-            async with httpx.AsyncClient() as client:
-                payload = {"custom_attributes": custom_attributes}
-
-                # Use POST to update attributes
-                response = await client.post(custom_attrs_url, json=payload, headers=self.headers)
-                response.raise_for_status()
-                if response.content and len(response.content.strip()) > 0:
-                    try:
-                        return response.json()
-                    except Exception as json_err:
-                        logger.warning(f"Failed to parse JSON response: {json_err}")
-                        return {}
-                return {}
-        except Exception as e:
-            logger.error(f"Failed to update custom attributes for conversation {conversation_id}: {e}")
-            raise
+        """Update custom attributes for a conversation using the provided account_id and conversation_id.
 
-    async def toggle_priority(self, conversation_id: int, priority: str) -> Dict[str, Any]:
+        Repeating the attributes last sent for the conversation skips the request and returns {"skipped": True}.
+        """
+        fingerprint = orjson.dumps(custom_attributes, option=orjson.OPT_SORT_KEYS)
+        sent = self._sent_custom_attributes
+        if sent.get(conversation_id) == fingerprint:
+            sent.move_to_end(conversation_id)
+            return {"skipped": True}
+        # Forget the previous value first: after a failed request the server state is unknown
+        sent.pop(conversation_id, None)
+
+        custom_attrs_url = f"/conversations/{conversation_id}/custom_attributes"
+        payload = {"custom_attributes": custom_attributes}
+        response = await self._client.post(custom_attrs_url, content=dump_json(payload))
+        response.raise_for_status()
+
+        sent[conversation_id] = fingerprint
+        if len(sent) > _CUSTOM_ATTRIBUTES_CACHE_SIZE:
+            sent.popitem(last=False)
+        return _json_or_empty(response)
+
+    @_chatwoot_call("toggle_priority", per_conversation=True)
+    async def toggle_priority(
+        self, conversation_id: int, priority: ConversationPriorityValue, parse_response: bool = True
+    ) -> Dict[str, Any] | None:
         """Toggle the priority of a conversation
         Valid priorities: 'urgent', 'high', 'medium', 'low', None
         """
-        url = f"{self.conversations_url}/{conversation_id}/toggle_priority"
+        url = f"/conversations/{conversation_id}/toggle_priority"
         data = {"priority": priority}
+        response = await self._post(url, data)
+        response.raise_for_status()
+        return _json_or_empty(response) if parse_response else None
+
+    async def _team_name_to_id(self, team_name: str) -> int:
+        """Resolve a team name to its id, refreshing the cached team map when stale."""
+        cache = self._team_map_cache
+        if cache is None or time.monotonic() - cache[0] >= _TEAM_MAP_TTL:
+            teams = await self.get_teams()
+            team_map = {team["name"].lower(): team["id"] for team in teams}
+            # get_teams returns [] on failure, so don't pin an empty map for the whole TTL
+            self._team_map_cache = (time.monotonic(), team_map) if team_map else None
+        else:
+            team_map = cache[1]
+        return team_map.get(team_name.lower(), 0)
 
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data, headers=self.headers)
-                response.raise_for_status()
-                if response.content and len(response.content.strip()) > 0:
-                    try:
-                        return response.json()
-                    except Exception as json_err:
-                        logger.warning(f"Failed to parse JSON response: {json_err}")
-                        return {}
-                return {}
-        except httpx.HTTPStatusError as e:
-            logger.error(
-                f"Priority update failed for conversation {conversation_id}:\n"
-                f"URL: {url}\nStatus: {e.response.status_code}\n"
-                f"Response: {e.response.text}\nPriority: {priority}",
-                exc_info=True,
-            )
-            raise
-
+    @_chatwoot_call("assign_team", per_conversation=True)
     async def assign_team(
-        self, conversation_id: int, team_id: int = 0, team_name: Optional[str] = None
-    ) -> Dict[str, Any]:
+        self,
+        conversation_id: int,
+        team_id: int = 0,
+        team_name: Optional[str] = None,
+        parse_response: bool = True,
+    ) -> Dict[str, Any] | None:
         """Assign a conversation to a team.
 
         Args:
             conversation_id: The ID of the conversation to assign
             team_id: The ID of the team to assign to
             team_name: The name of the team to assign to (will be looked up if provided)
+            parse_response: Set to False to skip decoding the reply and return None
         """
-        url = f"{self.conversations_url}/{conversation_id}/assignments"
+        url = f"/conversations/{conversation_id}/assignments"
 
         # Use team name to get team_id if provided
         if team_name and not team_id:
-            teams = await self.get_teams()
-            team_map = {team["name"].lower(): team["id"] for team in teams}
-            team_id = team_map.get(team_name.lower(), 0)
+            team_id = await self._team_name_to_id(team_name)
 
         data = {"team_id": team_id}
-
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data, headers=self.headers)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Failed to assign conversation {conversation_id} to team {team_id}: {e}")
-            raise
-
+        response = await self._post(url, data)
+        if team_name and response.status_code == 404:
+            # The cached id may belong to a deleted team; refetch on the next call
+            self._team_map_cache = None
+            self._teams_cache = None
+        response.raise_for_status()
+        return load_json(response) if parse_response else None
+
+    @_chatwoot_call("create_custom_attribute_definition")
     async def create_custom_attribute_definition(
         self,
         display_name: str,
@@ -248,144 +536,180 @@ class ChatwootHandler:
             }
         }
 
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data, headers=self.admin_headers)
-                response.raise_for_status()
-                return response.json()
-        except Exception as e:
-            logger.error(f"Failed to create custom attribute definition: {e}")
-            raise
+        response = await self._client.post(url, content=dump_json(data), headers=self.admin_headers)
+        response.raise_for_status()
+        return load_json(response)
 
     async def toggle_status(
         self,
         conversation_id: int,
-        status: str,
+        status: ConversationStatusValue,
         previous_status: Optional[str] = None,
         is_error_transition: bool = False,
-    ) -> Dict[str, Any]:
+        parse_response: bool = True,
+    ) -> Dict[str, Any] | None:
         """Toggle the status of a conversation
         Valid statuses: 'open', 'resolved', 'pending', 'snoozed'
+        Pass parse_response=False to skip decoding the reply and get None back.
         """
-        url = f"{self.conversations_url}/{conversation_id}/toggle_status"
+        return await self._post_toggle_status(conversation_id, status, parse_response)
+
+    @_chatwoot_call("toggle_status", per_conversation=True)
+    async def _post_toggle_status(
+        self, conversation_id: int, status: ConversationStatusValue, parse_response: bool = True
+    ) -> Dict[str, Any] | None:
+        url = f"/conversations/{conversation_id}/toggle_status"
         data = {"status": status}
+        response = await self._post(url, data)
+        response.raise_for_status()
+        return _json_or_empty(response) if parse_response else None
 
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(url, json=data, headers=self.headers)
-                response.raise_for_status()
-                if response.content and len(response.content.strip()) > 0:
-                    try:
-                        return response.json()
-                    except Exception as json_err:
-                        logger.warning(f"Failed to parse JSON response: {json_err}")
-                        return {}
-                return {}
-        except httpx.HTTPStatusError as e:
-            logger.error(
-                f"Status toggle failed for conversation {conversation_id}:\n"
-                f"URL: {url}\nStatus: {e.response.status_code}\n"
-                f"Response: {e.response.text}\nNew status: {status}",
-                exc_info=True,
-            )
-            raise
+    async def _gather_bounded(self, coros: List[Awaitable[Any]]) -> List[Any]:
+        semaphore = asyncio.Semaphore(_BULK_CONCURRENCY)
+
+        async def run(coro: Awaitable[Any]) -> Any:
+            async with semaphore:
+                return await coro
+
+        return await asyncio.gather(*(run(coro) for coro in coros))
+
+    async def send_messages(self, conversation_id: int, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Send several messages to a conversation concurrently.
+
+        Each item holds send_message keyword arguments, e.g. {"message": "...", "private": True}.
+        Results are returned in input order.
+        """
+        return await self._gather_bounded([self.send_message(conversation_id, **m) for m in messages])
+
+    async def add_labels_bulk(self, convo_to_labels: Dict[int, List[str]]) -> Dict[int, Dict[str, Any]]:
+        """Add labels to several conversations concurrently, keyed by conversation id."""
+        results = await self._gather_bounded(
+            [self.add_labels(conversation_id, labels) for conversation_id, labels in convo_to_labels.items()]
+        )
+        return dict(zip(convo_to_labels, results, strict=True))
+
+    async def toggle_status_bulk(
+        self, convo_to_status: Dict[int, ConversationStatusValue]
+    ) -> Dict[int, Dict[str, Any]]:
+        """Set the status of several conversations concurrently, keyed by conversation id."""
+        results = await self._gather_bounded(
+            [self.toggle_status(conversation_id, status) for conversation_id, status in convo_to_status.items()]
+        )
+        return dict(zip(convo_to_status, results, strict=True))
 
     def toggle_status_sync(
         self,
         conversation_id: int,
-        status: str,
+        status: ConversationStatusValue,
         previous_status: Optional[str] = None,
         is_error_transition: bool = False,
     ) -> Dict[str, Any]:
-        """Synchronous version of toggle_status for use in Celery tasks"""
-        import httpx
-
-        url = f"{self.conversations_url}/{conversation_id}/toggle_status"
-        data = {"status": status}
+        """Synchronous version of toggle_status for use in Celery tasks
 
-        try:
-            with httpx.Client() as client:
-                response = client.post(url, json=data, headers=self.headers, timeout=30.0)
-                response.raise_for_status()
-                if response.content and len(response.content.strip()) > 0:
-                    try:
-                        return response.json()
-                    except Exception as json_err:
-                        logger.warning(f"Failed to parse JSON response: {json_err}")
-                        return {}
-                return {}
-        except httpx.HTTPStatusError as e:
-            logger.error(
-                f"Status toggle (sync) failed for conversation {conversation_id}:\n"
-                f"URL: {url}\nStatus: {e.response.status_code}\n"
-                f"Response: {e.response.text}\nNew status: {status}",
-                exc_info=True,
+        Runs toggle_status on the process's persistent event loop, so it shares the async client's
+        connection pool.
+        """
+        return run_async(
+            self.toggle_status(
+                conversation_id,
+                status,
+                previous_status=previous_status,
+                is_error_transition=is_error_transition,
             )
-            raise
+        )
 
-    async def get_teams(self) -> List[Dict[str, Any]]:
-        """Get all teams for the account"""
-        url = f"{self.account_url}/teams"
+    async def get_teams(self, max_age: float = _TEAMS_TTL) -> List[Dict[str, Any]]:
+        """Get all teams for the account
+
+        A list fetched less than max_age seconds ago is reused; pass max_age=0 to force a fetch.
+        """
+        cache = self._teams_cache
+        if cache is not None and time.monotonic() - cache[0] < max_age:
+            return list(cache[1])
+
+        url = "/teams"
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, headers=self.admin_headers)
-                response.raise_for_status()
-                data = response.json()
-
-                # Safely extract teams from nested structure
-                if isinstance(data, dict) and "payload" in data:
-                    teams = data["payload"]
-                elif isinstance(data, list):
-                    teams = data
-                else:
-                    teams = []
-
-                logger.info(f"Retrieved {len(teams)} teams from Chatwoot")
-                return teams
+            response = await self._client.get(url, headers=self.admin_headers)
+            response.raise_for_status()
+            data = load_json(response)
+
+            # Safely extract teams from nested structure
+            if isinstance(data, dict) and "payload" in data:
+                teams = data["payload"]
+            elif isinstance(data, list):
+                teams = data
+            else:
+                teams = []
+
+            logger.info("Retrieved %d teams from Chatwoot", len(teams))
+            # Failures return [] below and are never cached
+            self._teams_cache = (time.monotonic(), teams)
+            return list(teams)
 
         except httpx.HTTPStatusError as e:
-            logger.error(
-                f"Get teams failed:\n" f"URL: {url}\nStatus: {e.response.status_code}\n" f"Response: {e.response.text}",
-                exc_info=True,
-            )
+            logger.error("Get teams failed: url=%s status=%s", e.request.url, e.response.status_code)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Get teams response body: %s", e.response.text)
             return []
         except Exception as e:
-            logger.error(f"Failed to get teams: {e}")
+            logger.error("Failed to get teams: %s", e)
             return []
 
-    async def get_conversation_list(self, status: str = "all", assignee_type: str = "all") -> List[Dict[str, Any]]:
-        """Get list of conversations with optional filtering"""
-        url = f"{self.conversations_url}"
+    async def get_conversation_list(
+        self, status: str = "all", assignee_type: str = "all", all_pages: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Get list of conversations with optional filtering
+
+        Chatwoot pages this endpoint. By default only the first page is returned; with
+        all_pages=True the remaining pages are fetched concurrently after the first.
+        """
+        url = "/conversations"
         params = {
             "status": status,
             "assignee_type": assignee_type,
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(url, params=params, headers=self.headers)
-                response.raise_for_status()
-                data = response.json()
-
-                # Extract conversations from response
-                if isinstance(data, dict) and "data" in data and "payload" in data["data"]:
-                    conversations = data["data"]["payload"]
-                elif isinstance(data, list):
-                    conversations = data
-                else:
-                    conversations = []
-
-                logger.info(f"Retrieved {len(conversations)} conversations from Chatwoot")
-                return conversations
+            response = await self._client.get(url, params=params)
+            response.raise_for_status()
+            data = load_json(response)
+
+            # Extract conversations from response
+            if isinstance(data, dict) and "data" in data and "payload" in data["data"]:
+                conversations = data["data"]["payload"]
+            elif isinstance(data, list):
+                conversations = data
+            else:
+                conversations = []
+
+            if all_pages and conversations and isinstance(data, dict):
+                meta = data["data"].get("meta", {})
+                total = meta.get(_ASSIGNEE_TYPE_COUNT_KEYS.get(assignee_type, "all_count"), 0)
+                total_pages = -(-total // _CONVERSATIONS_PAGE_SIZE)
+                pages = await self._gather_bounded(
+                    [self._client.get(url, params={**params, "page": page}) for page in range(2, total_pages + 1)]
+                )
+                for page_response in pages:
+                    page_response.raise_for_status()
+                    conversations.extend(load_json(page_response)["data"]["payload"])
+
+            logger.info("Retrieved %d conversations from Chatwoot", len(conversations))
+            return conversations
 
         except Exception as e:
-            logger.error(f"Failed to get conversation list: {e}")
+            logger.error("Failed to get conversation list: %s", e)
             return []
 
 
+@functools.lru_cache(maxsize=1)
+def get_chatwoot() -> ChatwootHandler:
+    """Return the process-wide handler; its async client is built lazily for the running loop."""
+    return ChatwootHandler()
+
+
 # Global handler instance
-chatwoot = ChatwootHandler()
+chatwoot = get_chatwoot()
 
 
 # FastAPI endpoints demonstrating new patterns
@@ -425,9 +749,11 @@ async def get_conversations(
     result = await db.execute(query)
     conversations = result.scalars().all()
 
-    # Count total for pagination info
-    count_result = await db.execute(select(Conversation).where(Conversation.status == status if status else True))
-    total = len(count_result.scalars().all())
+    # Count total for pagination info in the database instead of loading every row
+    count_query = select(func.count()).select_from(Conversation)
+    if status:
+        count_query = count_query.where(Conversation.status == status)
+    total = (await db.execute(count_query)).scalar_one()
 
     # Use Pydantic v2 model_validate with from_attributes for proper serialization
     conversation_responses = [ConversationResponse.model_validate(conv, from_attributes=True) for conv in conversations]
@@ -497,12 +823,9 @@ async def create_conversation(
     # Add to session
     db.add(conversation)
 
-    # Flush to populate auto-generated fields (id, created_at, updated_at) before response
-    # This ensures the database assigns the auto-increment ID and timestamps
+    # Flush so the INSERT runs before the response is built; the database assigns the ID and
+    # timestamps, and the model's eager_defaults reads them back through RETURNING
     await db.flush()
 
-    # Refresh to ensure all fields are loaded from the database
-    await db.refresh(conversation)
-
     # Use Pydantic v2 model_validate with from_attributes for response
     return ConversationResponse.model_validate(conversation, from_attributes=True)
@@ -0,0 +1,193 @@
+"""Async client for the Dify chat API."""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import httpx
+import orjson
+
+from app import config
+from app.utils.http import SSL_CONTEXT, LoopBoundClient, dump_json, load_json
+
+logger = logging.getLogger(__name__)
+
+
+class DifyClient:
+    def __init__(self, api_url: str | None = None, api_key: str | None = None):
+        self.api_url = api_url or config.DIFY_API_URL
+        self.api_key = api_key or config.DIFY_API_KEY
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+        # Shared client so concurrent Dify calls reuse keep-alive (HTTP/2) connections; built lazily
+        # per event loop, since the module-level instance is created at import time
+        self._clients = LoopBoundClient(
+            lambda: httpx.AsyncClient(
+                base_url=self.api_url,
+                headers=self.headers,
+                verify=SSL_CONTEXT,
+                http2=True,
+                timeout=httpx.Timeout(
+                    connect=config.HTTPX_CONNECT_TIMEOUT,
+                    read=config.HTTPX_READ_TIMEOUT,
+                    write=config.HTTPX_WRITE_TIMEOUT,
+                    pool=config.HTTPX_POOL_TIMEOUT,
+                ),
+                limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+            )
+        )
+
+    @property
+    def _client(self) -> httpx.AsyncClient:
+        return self._clients.get()
+
+    async def aclose(self) -> None:
+        """Close the shared HTTP client and release pooled connections."""
+        await self._clients.aclose()
+
+    async def __aenter__(self) -> "DifyClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    @staticmethod
+    def _chat_payload(
+        query: str, inputs: Dict[str, Any], conversation_id: Optional[str], user: str, response_mode: str
+    ) -> Dict[str, Any]:
+        data = {"query": query, "inputs": inputs, "response_mode": response_mode, "user": user}
+        if conversation_id:
+            data["conversation_id"] = conversation_id
+        return data
+
+    async def send_chat_message(
+        self,
+        query: str,
+        inputs: Dict[str, Any],
+        conversation_id: Optional[str] = None,
+        user: str = "user",
+        response_mode: Optional[str] = None,
+        on_first_token: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Dict[str, Any]:
+        """Send a chat message; without conversation_id Dify starts a new conversation.
+
+        In streaming mode the events are folded into the same shape as a blocking response, and
+        on_first_token (which must not raise) is awaited once the answer starts to arrive.
+        """
+        response_mode = response_mode or config.DIFY_RESPONSE_MODE
+        if response_mode == "streaming":
+            return await self._collect_stream(query, inputs, conversation_id, user, on_first_token)
+
+        data = self._chat_payload(query, inputs, conversation_id, user, response_mode)
+        response = await self._client.post("/chat-messages", content=dump_json(data))
+        if response.is_error:
+            logger.error("Dify API error response (%s): %s", response.status_code, response.text)
+        response.raise_for_status()
+        return load_json(response)
+
+    async def stream_chat_message(
+        self,
+        query: str,
+        inputs: Dict[str, Any],
+        conversation_id: Optional[str] = None,
+        user: str = "user",
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Send a chat message in streaming mode and yield Dify's events as they arrive."""
+        data = self._chat_payload(query, inputs, conversation_id, user, "streaming")
+        async with self._client.stream("POST", "/chat-messages", content=dump_json(data)) as response:
+            if response.is_error:
+                await response.aread()
+                logger.error("Dify API error response (%s): %s", response.status_code, response.text)
+                response.raise_for_status()
+            async for line in response.aiter_lines():
+                # Server-sent events: payload lines are "data: {...}", blank lines separate events
+                if line.startswith("data:"):
+                    yield orjson.loads(line[5:])
+
+    async def _collect_stream(
+        self,
+        query: str,
+        inputs: Dict[str, Any],
+        conversation_id: Optional[str],
+        user: str,
+        on_first_token: Optional[Callable[[], Awaitable[Any]]] = None,
+    ) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"event": "message"}
+        answer_parts: list[str] = []
+        async for event in self.stream_chat_message(query, inputs, conversation_id, user):
+            kind = event.get("event")
+            if kind == "error":
+                raise RuntimeError(f"Dify stream error ({event.get('code')}): {event.get('message')}")
+            if kind in ("message", "agent_message"):
+                if on_first_token is not None and not answer_parts:
+                    await on_first_token()
+                answer_parts.append(event.get("answer") or "")
+            elif kind == "message_end":
+                result["metadata"] = event.get("metadata")
+            for key in ("task_id", "message_id", "conversation_id", "created_at"):
+                if key in event:
+                    result.setdefault(key, event[key])
+        result["answer"] = "".join(answer_parts)
+        return result
+
+    async def delete_conversation(self, conversation_id: str) -> None:
+        """Delete a conversation from Dify."""
+        try:
+            response = await self._client.delete(f"/conversations/{conversation_id}")
+            response.raise_for_status()
+            logger.info("Successfully deleted Dify conversation: %s", conversation_id)
+        except Exception as e:
+            logger.error("Failed to delete Dify conversation %s: %s", conversation_id, e)
+            raise
+
+
+class DifyBatchDeleter:
+    """Collects conversation deletions and issues them concurrently in small batches.
+
+    Ids queued within the batch interval share one flush, so several deletions go out as
+    parallel streams on the client's HTTP/2 connection instead of one after another.
+    """
+
+    def __init__(self, client: DifyClient, max_batch: int = 20, interval: float = 0.02):
+        self._client = client
+        self._max_batch = max_batch
+        self._interval = interval
+        self._queue: asyncio.Queue[str | None] | None = None
+        self._worker: asyncio.Task | None = None
+
+    def enqueue(self, conversation_id: str) -> None:
+        """Queue a conversation for deletion, starting the worker on first use."""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        self._queue.put_nowait(conversation_id)
+
+    async def _run(self) -> None:
+        queue = self._queue
+        stopping = False
+        while not stopping:
+            batch = [await queue.get()]
+            await asyncio.sleep(self._interval)
+            while len(batch) < self._max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            # None is the shutdown sentinel; everything queued before it still gets deleted
+            stopping = None in batch
+            ids = [conversation_id for conversation_id in batch if conversation_id is not None]
+            if ids:
+                # delete_conversation logs its own failures
+                await asyncio.gather(*(self._client.delete_conversation(cid) for cid in ids), return_exceptions=True)
+
+    async def aclose(self) -> None:
+        """Flush queued deletions and stop the worker."""
+        if self._worker is not None and not self._worker.done():
+            self._queue.put_nowait(None)
+            await self._worker
+        self._worker = None
+
+
+# Global client instance
+dify = DifyClient()
+dify_deleter = DifyBatchDeleter(dify)
@@ -6,14 +6,12 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.chatwoot import ChatwootHandler
+from app.api.chatwoot import chatwoot
 from app.db.session import async_engine, get_session
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-chatwoot = ChatwootHandler()
-
 
 @router.get("", status_code=status.HTTP_200_OK)
 async def health_check() -> Dict[str, Any]:
@@ -32,7 +30,7 @@ async def health_check() -> Dict[str, Any]:
             "db_value": value
         }
     except Exception as e:
-        logger.error(f"Health check failed: {e}")
+        logger.error("Health check failed: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Health check failed: {str(e)}"
@@ -87,7 +85,7 @@ async def create_test_conversation(db: AsyncSession = Depends(get_session)) -> D
                 "timestamp": time.time(),
             }
     except Exception as e:
-        logger.error(f"Failed to create test conversation: {e}")
+        logger.error("Failed to create test conversation: %s", e)
         raise HTTPException(
             status_code=500,
             detail=f"Failed to create test conversation: {str(e)}"
@@ -1,27 +1,34 @@
 import asyncio
+import contextlib
 import logging
+import time
 from contextlib import asynccontextmanager
-from datetime import UTC, datetime
-from typing import Any, Dict, List, Optional
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional
 
+import orjson
 from fastapi import (
     APIRouter,
-    BackgroundTasks,
     Body,
     Depends,
     FastAPI,
     HTTPException,
     Request,
 )
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
 from app import tasks
-from app.api.chatwoot import ChatwootHandler
+from app.api.chatwoot import chatwoot
+from app.api.dify import dify, dify_deleter
 from app.config import (
     BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL,
-    BOT_ERROR_MESSAGE_INTERNAL,
     ENABLE_TEAM_CACHE,
+    SELF_MESSAGE_PREFIXES,
+    TEAM_CACHE_REFRESH_SECONDS,
     TEAM_CACHE_TTL_HOURS,
 )
 from app.db.session import get_session
@@ -37,45 +44,101 @@ from app.utils import handle_api_errors
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-chatwoot = ChatwootHandler()
 
-# Team management - only initialize if caching is enabled
-team_cache: Dict[str, int] = {} if ENABLE_TEAM_CACHE else {}
+
+class TeamCacheSnapshot(NamedTuple):
+    """Team lookup state; refreshes swap in a new snapshot, so lookups read it without the lock."""
+
+    by_lower: Mapping[str, int]  # lowercase team name -> team id
+    display_names: tuple[str, ...]  # team names as shown in Chatwoot, for error messages
+    updated_at: float  # time.monotonic() of the refresh
+
+
+# Team management
+team_cache_snapshot = TeamCacheSnapshot(MappingProxyType({}), (), 0.0)
 team_cache_lock = asyncio.Lock() if ENABLE_TEAM_CACHE else None
-last_update_time = 0
+
+# Dialect-specific INSERT constructs that support ON CONFLICT ... DO UPDATE
+_UPSERT_INSERTS = {"postgresql": postgresql_insert, "sqlite": sqlite_insert}
+
+# Fire-and-forget tasks started from request handlers; held here so they aren't garbage collected
+_background_tasks: set[asyncio.Task] = set()
+
+
+def _spawn(coro) -> asyncio.Task:
+    """Run a coroutine in the background, keeping a reference until it finishes."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _is_own_message_event(payload: Any) -> bool:
+    """Check the raw payload for a message_created event the bot should ignore.
+
+    Only looks at the few fields it needs, so skipped events never go through ChatwootWebhook
+    validation. Events without a valid message_type fall through and get the usual 422.
+    """
+    if not isinstance(payload, dict) or payload.get("event") != "message_created":
+        return False
+    if payload.get("message_type") not in ("incoming", "outgoing"):
+        return False
+    sender = payload.get("sender")
+    if isinstance(sender, dict) and sender.get("type") == "agent_bot":  # бот не реагирует на свои мессаги
+        return True
+    content = payload.get("content")
+    return isinstance(content, str) and content.startswith(SELF_MESSAGE_PREFIXES)
+
+
+async def _notify_processing_error(conversation_id: int) -> None:
+    """Tell the customer their message could not be processed; failures are only logged."""
+    try:
+        await chatwoot.send_message(
+            conversation_id=conversation_id,
+            message=BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL,
+            private=False,
+        )
+    except Exception as send_error:
+        logger.error("Failed to send error message to Chatwoot: %s", send_error)
 
 
 async def get_or_create_conversation(db: AsyncSession, data: ConversationCreate) -> Conversation:
     """
     Get existing conversation or create a new one.
     Updates the conversation if it exists with new data.
-    Uses optimized SQLAlchemy 2.x query patterns.
+    Uses a single INSERT ... ON CONFLICT DO UPDATE ... RETURNING round trip where the dialect supports it.
     """
-    # Use SQLAlchemy 2.x select syntax with proper type hints
+    conversation_data = data.model_dump(exclude={"id"})
+    update_data = data.model_dump(exclude_unset=True, exclude={"id"})
+    update_data["updated_at"] = func.now()
+
+    upsert = _UPSERT_INSERTS.get(db.get_bind().dialect.name)
+    if upsert is not None:
+        statement = (
+            upsert(Conversation)
+            .values(**conversation_data)
+            .on_conflict_do_update(index_elements=[Conversation.chatwoot_conversation_id], set_=update_data)
+            .returning(Conversation)
+        )
+        # populate_existing so an instance already in the session picks up the upserted row
+        result = await db.execute(statement, execution_options={"populate_existing": True})
+        return result.scalar_one()
+
+    # Fallback for dialects without ON CONFLICT support
     statement = select(Conversation).where(Conversation.chatwoot_conversation_id == data.chatwoot_conversation_id)
     result = await db.execute(statement)
     conversation = result.scalar_one_or_none()
 
     if conversation:
-        # Update existing conversation with new data using Pydantic model_dump
-        update_data = data.model_dump(exclude_unset=True, exclude={"id"})
         for field, value in update_data.items():
             if hasattr(conversation, field):
                 setattr(conversation, field, value)
-        conversation.updated_at = datetime.now(UTC)
     else:
-        # Create new conversation using Pydantic model_dump
-        conversation_data = data.model_dump(exclude={"id"})
         conversation = Conversation(**conversation_data)
         db.add(conversation)
-
-        # Flush to populate auto-generated fields (id, created_at, updated_at)
-        # This ensures the database assigns the auto-increment ID and timestamps
+        # Flush so the database assigns id and timestamps; eager_defaults reads them back
         await db.flush()
 
-        # Refresh to ensure all fields are loaded from the database
-        await db.refresh(conversation)
-
     # Note: No manual commit needed - six-line pattern handles this automatically
     # The transaction will be committed when the context manager exits successfully
     return conversation
@@ -104,21 +167,27 @@ async def send_chatwoot_message(
 @router.post("/chatwoot-webhook")
 async def chatwoot_webhook(
     request: Request,
-    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_session),
 ) -> Dict[str, Any]:
     """Process Chatwoot webhook events."""
     webhook_data = None
 
     try:
-        print("Received Chatwoot webhook request")
-        payload = await request.json()
+        payload = orjson.loads(await request.body())
+
+        # Most message events are the bot's own messages echoed back; drop them before paying
+        # for full validation
+        if _is_own_message_event(payload):
+            logger.info("Skipping agent_bot message: %s", payload.get("content"))
+            return {"status": "skipped", "reason": "agent_bot message"}
 
         # Use Pydantic v2 model_validate for webhook data validation
         webhook_data = ChatwootWebhook.model_validate(payload)
 
-        logger.info(f"Received webhook event: {webhook_data.event}")
-        logger.debug(f"Webhook payload: {payload}")
+        logger.info("Received webhook event: %s", webhook_data.event)
+        # Payloads can be large; only format them when DEBUG is actually on
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Webhook payload: %s", payload)
 
         if webhook_data.event == "message_created":
             if webhook_data.message_type not in ("incoming", "outgoing"):
@@ -129,28 +198,19 @@ async def chatwoot_webhook(
                         "message": "message_type is required for message_created events",
                     },
                 )
-            logger.info(f"Webhook data: {webhook_data}")
-            if webhook_data.sender_type in [
-                "agent_bot",
-                "????",
-            ]:  # бот не реагирует на свои мессаги
-                logger.info(f"Skipping agent_bot message: {webhook_data.content}")
-                return {"status": "skipped", "reason": "agent_bot message"}
-
-            if str(webhook_data.content).startswith(BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL) or str(
-                webhook_data.content
-            ).startswith(BOT_ERROR_MESSAGE_INTERNAL):
-                logger.info(f"Skipping agent_bot message: {webhook_data.content}")
-                return {"status": "skipped", "reason": "agent_bot message"}
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Webhook data: %s", webhook_data)
 
             if True:  # we'll see if we need to filter by status later
-                print(f"Processing message: {webhook_data}")
+                logger.info("Processing message for conversation %s", webhook_data.conversation_id)
                 try:
                     conversation_data = webhook_data.to_conversation_create()
                     conversation = await get_or_create_conversation(db, conversation_data)
 
-                    # Start the task and return immediately
-                    tasks.process_message_with_dify.apply_async(
+                    # Start the task and return immediately; it posts the answer to Chatwoot itself.
+                    # Publishing is blocking broker I/O, so it runs in a worker thread to keep the event loop free
+                    await asyncio.to_thread(
+                        tasks.process_message_with_dify.apply_async,
                         args=[
                             webhook_data.content,
                             conversation.dify_conversation_id,
@@ -158,9 +218,7 @@ async def chatwoot_webhook(
                             conversation.status,
                             webhook_data.message_type,
                         ],
-                        link=tasks.handle_dify_response.s(
-                            conversation_id=webhook_data.conversation_id,
-                        ),
+                        kwargs={"message_id": webhook_data.id},
                         link_error=tasks.handle_dify_error.s(
                             conversation_id=webhook_data.conversation_id,
                         ),
@@ -169,18 +227,12 @@ async def chatwoot_webhook(
                     return {"status": "processing"}
 
                 except Exception as e:
-                    logger.error(f"Failed to process message with Dify: {e}", exc_info=True)
+                    logger.error("Failed to process message with Dify: %s", e, exc_info=True)
 
-                    # Try to send error message to Chatwoot if conversation_id is available
+                    # Try to send error message to Chatwoot if conversation_id is available,
+                    # without holding the error response for a Chatwoot round trip
                     if webhook_data and webhook_data.conversation_id is not None:
-                        try:
-                            await chatwoot.send_message(
-                                conversation_id=webhook_data.conversation_id,
-                                message=BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL,
-                                private=False,
-                            )
-                        except Exception as send_error:
-                            logger.error(f"Failed to send error message to Chatwoot: {send_error}")
+                        _spawn(_notify_processing_error(webhook_data.conversation_id))
 
                     # Re-raise the original exception to trigger proper error handling
                     raise
@@ -206,20 +258,27 @@ async def chatwoot_webhook(
                 return {"status": "skipped", "reason": "no conversation data"}
 
             conversation_id = str(webhook_data.conversation.id)
-            statement = select(Conversation).where(Conversation.chatwoot_conversation_id == conversation_id)
+            # Delete and fetch the Dify ID in one round trip instead of loading the row first
+            statement = (
+                delete(Conversation)
+                .where(
+                    Conversation.chatwoot_conversation_id == conversation_id,
+                    Conversation.dify_conversation_id.is_not(None),
+                )
+                .returning(Conversation.dify_conversation_id)
+            )
             result = await db.execute(statement)
-            conversation = result.scalar_one_or_none()
+            dify_conversation_id = result.scalar_one_or_none()
 
-            if conversation and conversation.dify_conversation_id:
-                background_tasks.add_task(tasks.delete_dify_conversation, conversation.dify_conversation_id)
-                await db.delete(conversation)
+            if dify_conversation_id:
+                dify_deleter.enqueue(dify_conversation_id)
                 # Note: No manual commit needed - six-line pattern handles this automatically
 
         return {"status": "success"}
 
     except ValueError as e:
         # Pydantic validation errors or other value-related errors
-        logger.error(f"Validation error in webhook: {e}", exc_info=True)
+        logger.error("Validation error in webhook: %s", e, exc_info=True)
         raise HTTPException(
             status_code=422,
             detail={
@@ -231,7 +290,7 @@ async def chatwoot_webhook(
 
     except Exception as e:
         # Database errors (including transaction errors) and other unexpected errors
-        logger.error(f"Unexpected error in webhook processing: {e}", exc_info=True)
+        logger.error("Unexpected error in webhook processing: %s", e, exc_info=True)
 
         # For database transaction errors, the six-line pattern will handle rollback automatically
         # We just need to provide a proper error response
@@ -269,14 +328,13 @@ async def update_custom_attributes(
     """Update custom attributes for a Chatwoot conversation."""
     result = await chatwoot.update_custom_attributes(conversation_id, custom_attributes)
 
-    # Update local conversation record if it exists
-    statement = select(Conversation).where(Conversation.chatwoot_conversation_id == str(conversation_id))
-    result_db = await db.execute(statement)
-    conversation = result_db.scalar_one_or_none()
-
-    if conversation:
-        conversation.updated_at = datetime.now(UTC)
-        # Note: No manual commit needed - six-line pattern handles this automatically
+    # Touch the local conversation record if it exists; the database clock stamps updated_at
+    await db.execute(
+        update(Conversation)
+        .where(Conversation.chatwoot_conversation_id == str(conversation_id))
+        .values(updated_at=func.now())
+    )
+    # Note: No manual commit needed - six-line pattern handles this automatically
 
     return {
         "status": "success",
@@ -302,14 +360,13 @@ async def toggle_conversation_priority(
     priority_value = priority.value if priority else None
     result = await chatwoot.toggle_priority(conversation_id, priority_value)
 
-    # Update local conversation record if it exists
-    statement = select(Conversation).where(Conversation.chatwoot_conversation_id == str(conversation_id))
-    result_db = await db.execute(statement)
-    conversation = result_db.scalar_one_or_none()
-
-    if conversation:
-        conversation.updated_at = datetime.now(UTC)
-        # Note: No manual commit needed - six-line pattern handles this automatically
+    # Touch the local conversation record if it exists; the database clock stamps updated_at
+    await db.execute(
+        update(Conversation)
+        .where(Conversation.chatwoot_conversation_id == str(conversation_id))
+        .values(updated_at=func.now())
+    )
+    # Note: No manual commit needed - six-line pattern handles this automatically
 
     return {
         "status": "success",
@@ -362,29 +419,37 @@ async def get_chatwoot_messages(conversation_id: int) -> List[Dict[str, Any]]:
     return messages
 
 
-async def update_team_cache():
-    """Update team cache from Chatwoot API if caching is enabled."""
-    global team_cache, last_update_time
+def _team_cache_is_fresh(snapshot: TeamCacheSnapshot) -> bool:
+    return bool(snapshot.by_lower) and time.monotonic() - snapshot.updated_at <= TEAM_CACHE_TTL_HOURS * 3600
+
+
+async def update_team_cache(only_if_stale: bool = False) -> Mapping[str, int]:
+    """Update team cache from Chatwoot API if caching is enabled.
+
+    With only_if_stale, a refresh finished by another request while waiting for the lock is reused.
+    """
+    global team_cache_snapshot
 
     if not ENABLE_TEAM_CACHE:
         logger.warning("Team caching is disabled. Skipping cache update.")
         return {}
 
     async with team_cache_lock:
+        if only_if_stale and _team_cache_is_fresh(team_cache_snapshot):
+            return team_cache_snapshot.by_lower
         try:
-            teams = await chatwoot.get_teams()
+            teams = await chatwoot.get_teams(max_age=0)
 
             # Create case-insensitive mappings from name to ID
-            new_cache = {team["name"].lower(): team["id"] for team in teams}
+            new_cache = MappingProxyType({team["name"].lower(): team["id"] for team in teams})
 
-            # Update the cache
-            team_cache = new_cache
-            last_update_time = datetime.now(UTC).timestamp()
+            # Swap in the new snapshot in one assignment
+            team_cache_snapshot = TeamCacheSnapshot(new_cache, tuple(team["name"] for team in teams), time.monotonic())
 
-            logger.info(f"Updated team cache with {len(team_cache)} teams")
-            return team_cache
+            logger.info("Updated team cache with %d teams", len(new_cache))
+            return new_cache
         except Exception as e:
-            logger.error(f"Failed to update team cache: {e}", exc_info=True)
+            logger.error("Failed to update team cache: %s", e, exc_info=True)
             raise
 
 
@@ -404,15 +469,27 @@ async def get_team_id(team_name: str) -> Optional[int]:
             team_map = {team["name"].lower(): team["id"] for team in teams}
             return team_map.get(team_name.lower())
         except Exception as e:
-            logger.error(f"Failed to get team ID for '{team_name}' (no cache): {e}")
+            logger.error("Failed to get team ID for '%s' (no cache): %s", team_name, e)
             return None
 
-    # Use cache when enabled
-    cache_age_hours = (datetime.now(UTC).timestamp() - last_update_time) / 3600
-    if not team_cache or cache_age_hours > TEAM_CACHE_TTL_HOURS:
-        await update_team_cache()
+    # Use cache when enabled. The background refresher keeps it current; only a snapshot
+    # older than the TTL (refresher failing) is refreshed inline.
+    snapshot = team_cache_snapshot
+    if not _team_cache_is_fresh(snapshot):
+        return (await update_team_cache(only_if_stale=True)).get(team_name.lower())
+
+    return snapshot.by_lower.get(team_name.lower())
 
-    return team_cache.get(team_name.lower())
+
+async def _periodic_team_refresh(interval: float) -> None:
+    """Refresh the team cache every interval seconds until cancelled."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await update_team_cache()
+        except Exception:
+            # update_team_cache already logged it; keep serving the previous snapshot
+            pass
 
 
 @router.post("/refresh-teams")
@@ -421,7 +498,7 @@ async def refresh_teams_cache():
     """Manually refresh the team cache."""
     if not ENABLE_TEAM_CACHE:
         # When caching is disabled, just return current teams from API
-        teams = await chatwoot.get_teams()
+        teams = await chatwoot.get_teams(max_age=0)
         return {"status": "success", "teams": len(teams), "cache_enabled": False}
 
     teams = await update_team_cache()
@@ -444,7 +521,7 @@ async def assign_conversation_to_team(
         return {"status": "success", "conversation_id": conversation_id, "team": "None"}
 
     # Log the attempt
-    logger.info(f"Attempting to assign conversation {conversation_id} to team {team}")
+    logger.info("Attempting to assign conversation %s to team %s", conversation_id, team)
 
     # Get team_id from name
     team_id = await get_team_id(team)
@@ -459,7 +536,7 @@ async def assign_conversation_to_team(
             # Get available teams for error message
             try:
                 if ENABLE_TEAM_CACHE:
-                    available_teams = list(team_cache.keys())
+                    available_teams = list(team_cache_snapshot.display_names)
                 else:
                     teams = await chatwoot.get_teams()
                     available_teams = [team["name"].lower() for team in teams]
@@ -474,17 +551,16 @@ async def assign_conversation_to_team(
     # Assign the conversation to the team
     result = await chatwoot.assign_team(conversation_id=conversation_id, team_id=team_id)
 
-    # Update local conversation record if it exists
-    statement = select(Conversation).where(Conversation.chatwoot_conversation_id == str(conversation_id))
-    result_db = await db.execute(statement)
-    conversation = result_db.scalar_one_or_none()
-
-    if conversation:
-        conversation.updated_at = datetime.now(UTC)
-        # Note: No manual commit needed - six-line pattern handles this automatically
+    # Touch the local conversation record if it exists; the database clock stamps updated_at
+    await db.execute(
+        update(Conversation)
+        .where(Conversation.chatwoot_conversation_id == str(conversation_id))
+        .values(updated_at=func.now())
+    )
+    # Note: No manual commit needed - six-line pattern handles this automatically
 
     # Log successful result
-    logger.info(f"Successfully assigned conversation {conversation_id} to team {team} (ID: {team_id})")
+    logger.info("Successfully assigned conversation %s to team %s (ID: %s)", conversation_id, team, team_id)
 
     return {
         "status": "success",
@@ -503,16 +579,12 @@ async def toggle_conversation_status(
     db: AsyncSession = Depends(get_session),
 ) -> Dict[str, Any]:
     """Toggle the status of a Chatwoot conversation using optimized patterns."""
-    # Get current conversation data to find out the previous status
-    previous_status_val: Optional[str] = None
-    try:
-        conversation_data = await chatwoot.get_conversation_data(conversation_id)
-        previous_status_val = conversation_data.get("status")
-        logger.info(f"Current status for convo {conversation_id} before toggle: {previous_status_val}")
-    except Exception as e_get_status:
-        # Log the error but proceed, previous_status will be None
-        # The notification logic in toggle_status handles previous_status being None
-        logger.warning(f"Could not fetch current status for convo {conversation_id} before toggle: {e_get_status}")
+    # The local record tracks the status from the last webhook, so it stands in for the previous
+    # status instead of an extra Chatwoot round trip; without a record it is simply left as None
+    statement = select(Conversation).where(Conversation.chatwoot_conversation_id == str(conversation_id))
+    result_db = await db.execute(statement)
+    conversation = result_db.scalar_one_or_none()
+    previous_status_val: Optional[str] = conversation.status if conversation else None
 
     result = await chatwoot.toggle_status(
         conversation_id=conversation_id,
@@ -522,13 +594,9 @@ async def toggle_conversation_status(
     )
 
     # Update local conversation record if it exists
-    statement = select(Conversation).where(Conversation.chatwoot_conversation_id == str(conversation_id))
-    result_db = await db.execute(statement)
-    conversation = result_db.scalar_one_or_none()
-
     if conversation:
+        # Changing status lets onupdate stamp updated_at from the database clock
         conversation.status = status.value
-        conversation.updated_at = datetime.now(UTC)
         # Note: No manual commit needed - six-line pattern handles this automatically
 
     return {
@@ -548,9 +616,11 @@ async def lifespan(app: FastAPI):
     logger.info("Application startup: Database tables checked/created.")
     # Consider any other startup logic here, e.g., initializing caches, connecting to external services
 
+    team_refresh_task = None
     if ENABLE_TEAM_CACHE:
         await update_team_cache()
-        logger.info(f"Initialized team cache with {len(team_cache)} teams")
+        logger.info("Initialized team cache with %d teams", len(team_cache_snapshot.by_lower))
+        team_refresh_task = asyncio.create_task(_periodic_team_refresh(TEAM_CACHE_REFRESH_SECONDS))
     else:
         logger.info("Team caching is disabled. Teams will be fetched directly from API.")
 
@@ -559,3 +629,13 @@ async def lifespan(app: FastAPI):
     # Application shutdown
     # Consider any cleanup logic here, e.g., closing connections, saving state
     logger.info("Application shutdown: Cleaning up resources.")
+    if team_refresh_task is not None:
+        team_refresh_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await team_refresh_task
+    # Let in-flight error notifications finish before their client is closed
+    if _background_tasks:
+        await asyncio.gather(*_background_tasks, return_exceptions=True)
+    await chatwoot.aclose()
+    await dify_deleter.aclose()
+    await dify.aclose()
@@ -37,14 +37,42 @@ worker_concurrency = int(os.getenv("CELERY_WORKER_CONCURRENCY", "4"))
 task_time_limit = int(os.getenv("CELERY_TASK_TIME_LIMIT", "300"))
 task_soft_time_limit = int(os.getenv("CELERY_TASK_SOFT_TIME_LIMIT", "240"))
 task_max_retries = int(os.getenv("CELERY_TASK_MAX_RETRIES", "3"))
-worker_max_tasks_per_child = int(os.getenv("CELERY_TASK_MAX_TASKS_PER_CHILD", "100"))
+worker_max_tasks_per_child = int(os.getenv("CELERY_TASK_MAX_TASKS_PER_CHILD", "500"))
 worker_prefetch_multiplier = int(os.getenv("CELERY_WORKER_PREFETCH_MULTIPLIER", "1"))
+# Ack after the task finishes, so a Dify call cut short when the whole worker goes away is redelivered, not dropped
+task_acks_late = os.getenv("CELERY_TASK_ACKS_LATE", "True").lower() in ("true", "1", "t")
+# A pool process killed mid-task (crash, OOM, hard time limit) fails the task instead of requeueing it; requeueing
+# would redeliver a message that keeps killing its worker forever, and the dedup claim lets the same task through
+task_reject_on_worker_lost = os.getenv("CELERY_TASK_REJECT_ON_WORKER_LOST", "False").lower() in ("true", "1", "t")
+# Dify calls take seconds; the short Chatwoot/cleanup tasks get their own queue so they don't wait behind them.
+# Workers must consume these queues (-Q), see docker-compose.yml
+task_routes = {
+    "app.tasks.process_message_with_dify": {"queue": "dify_longrun"},
+    "app.tasks.handle_dify_response": {"queue": "dify_short"},
+    "app.tasks.handle_dify_error": {"queue": "dify_short"},
+    "app.tasks.delete_dify_conversation": {"queue": "dify_short"},
+}
+# Workers accept orjson (registered in app.tasks) as well as plain json. Producers keep publishing json until
+# every worker runs this code; workers from an older deploy reject orjson messages. Once they are all replaced,
+# set CELERY_TASK_SERIALIZER=orjson and CELERY_RESULT_SERIALIZER=orjson.
+task_serializer = os.getenv("CELERY_TASK_SERIALIZER", "json")
+result_serializer = os.getenv("CELERY_RESULT_SERIALIZER", "json")
+accept_content = ["orjson", "json"]
+result_accept_content = ["orjson", "json"]
+# Redis redelivers unacked tasks after this many seconds; keep it above task_time_limit plus retry countdowns
+broker_transport_options = {"visibility_timeout": int(os.getenv("CELERY_VISIBILITY_TIMEOUT", "3600"))}
 
 # Celery 6.0 compatibility settings
 broker_connection_retry_on_startup = True  # Retain current behavior for connection retries
 
 # Custom settings for our application
+# Retries back off exponentially from this base delay with full jitter, capped at CELERY_RETRY_BACKOFF_MAX seconds
 CELERY_RETRY_COUNTDOWN = int(os.getenv("CELERY_RETRY_COUNTDOWN", "5"))
+CELERY_RETRY_BACKOFF_MAX = int(os.getenv("CELERY_RETRY_BACKOFF_MAX", "30"))
+# How long a Chatwoot message id is remembered so redelivered webhooks don't reach Dify twice (0 disables)
+MESSAGE_DEDUP_TTL_SECONDS = int(os.getenv("MESSAGE_DEDUP_TTL_SECONDS", "300"))
+# How long a Dify conversation that answered 404 is remembered, so queued messages start a new one directly
+DIFY_DEAD_CONVERSATION_TTL_SECONDS = int(os.getenv("DIFY_DEAD_CONVERSATION_TTL_SECONDS", "3600"))
 
 # Dify.ai configuration
 DIFY_API_URL = os.getenv("DIFY_API_URL", "https://api.dify.ai/v1")
@@ -62,17 +90,27 @@ CHATWOOT_API_KEY = os.getenv("CHATWOOT_API_KEY", "")
 CHATWOOT_ADMIN_API_KEY = os.getenv("CHATWOOT_ADMIN_API_KEY", "")
 CHATWOOT_ACCOUNT_ID = os.getenv("CHATWOOT_ACCOUNT_ID", "1")
 ALLOWED_CONVERSATION_STATUSES = os.getenv("ALLOWED_CONVERSATION_STATUSES", "open,pending").split(",")
+# Public replies to one conversation arriving within this window are joined into a single message (0 disables)
+CHATWOOT_SEND_BATCH_WINDOW_MS = int(os.getenv("CHATWOOT_SEND_BATCH_WINDOW_MS", "0"))
+# Ceiling for concurrent Chatwoot API calls; the effective limit halves on 429/503 and recovers on success
+CHATWOOT_MAX_CONCURRENCY = int(os.getenv("CHATWOOT_MAX_CONCURRENCY", "20"))
+# Retries of a call that keeps getting 429/503 before the error is raised
+CHATWOOT_OVERLOAD_RETRIES = int(os.getenv("CHATWOOT_OVERLOAD_RETRIES", "3"))
 
 # Team cache configuration - disabled by default for better API reliability
 ENABLE_TEAM_CACHE = os.getenv("ENABLE_TEAM_CACHE", "False").lower() in ("true", "1", "t")
 TEAM_CACHE_TTL_HOURS = int(os.getenv("TEAM_CACHE_TTL_HOURS", "24"))  # Cache for 24 hours by default
+# Background refresh interval; the TTL above only matters if refreshing keeps failing
+TEAM_CACHE_REFRESH_SECONDS = int(os.getenv("TEAM_CACHE_REFRESH_SECONDS", "600"))
 
 # SQLAlchemy engine configuration
-DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
-DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
 DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
 DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # 30 minutes
 DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "True").lower() in ("true", "1", "t")
+# Compiled SQL statements kept per engine (SQLAlchemy's default is 500)
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
 
 # Testing configuration
 TEST_CONVERSATION_ID = os.getenv("TEST_CONVERSATION_ID", "20")
@@ -112,6 +150,9 @@ BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL = os.getenv(
     "Your conversation has been transferred to operators. Don't worry, they will contact you!",
 )
 
+# Prefixes of the bot's own messages, checked with a single str.startswith(tuple) call
+SELF_MESSAGE_PREFIXES = (BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL, BOT_ERROR_MESSAGE_INTERNAL)
+
 
 def valid_statuses() -> List[str]:
     valid = ["open", "pending", "resolved", "snoozed", "closed"]
@@ -0,0 +1,84 @@
+"""Align the conversation table with the models
+
+Revision ID: 4b7e2d1c9a05
+Revises:
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "4b7e2d1c9a05"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Fresh databases get the current schema from create_all at startup
+    if not sa.inspect(op.get_bind()).has_table("conversation"):
+        return
+
+    # Keep one row per Chatwoot conversation, preferring the one linked to Dify and then the newest
+    op.execute(
+        """
+        DELETE FROM conversation WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY chatwoot_conversation_id
+                    ORDER BY dify_conversation_id IS NULL, updated_at DESC, id DESC
+                ) AS duplicate_rank
+                FROM conversation
+            ) AS ranked
+            WHERE duplicate_rank > 1
+        )
+        """
+    )
+    # ON CONFLICT (chatwoot_conversation_id) needs a unique index on the column
+    op.drop_index("ix_conversation_chatwoot_conversation_id", table_name="conversation", if_exists=True)
+    op.create_index(
+        "ix_conversation_chatwoot_conversation_id", "conversation", ["chatwoot_conversation_id"], unique=True
+    )
+
+    # Several rows sharing a Dify conversation keep it on the newest one; the rest start a new conversation
+    op.execute(
+        """
+        UPDATE conversation SET dify_conversation_id = NULL WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY dify_conversation_id ORDER BY updated_at DESC, id DESC
+                ) AS duplicate_rank
+                FROM conversation
+                WHERE dify_conversation_id IS NOT NULL
+            ) AS ranked
+            WHERE duplicate_rank > 1
+        )
+        """
+    )
+    op.drop_index("ix_conversation_dify_conversation_id", table_name="conversation", if_exists=True)
+    op.create_index("ix_conversation_dify_conversation_id", "conversation", ["dify_conversation_id"], unique=True)
+
+    # Backs the status filter on the conversation list
+    op.create_index("ix_conversation_status", "conversation", ["status"], if_not_exists=True)
+
+    # Inserts leave the timestamps to the database clock
+    with op.batch_alter_table("conversation") as batch_op:
+        batch_op.alter_column("created_at", server_default=sa.func.now())
+        batch_op.alter_column("updated_at", server_default=sa.func.now())
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table("conversation") as batch_op:
+        batch_op.alter_column("created_at", server_default=None)
+        batch_op.alter_column("updated_at", server_default=None)
+
+    op.drop_index("ix_conversation_status", table_name="conversation")
+    op.drop_index("ix_conversation_dify_conversation_id", table_name="conversation")
+    op.drop_index("ix_conversation_chatwoot_conversation_id", table_name="conversation")
+    op.create_index("ix_conversation_chatwoot_conversation_id", "conversation", ["chatwoot_conversation_id"])
@@ -1,9 +1,9 @@
 """SQLAlchemy 2 database models with dataclass mapping."""
 
-from datetime import UTC, datetime
+from datetime import datetime
 from typing import Optional
 
-from sqlalchemy import DateTime
+from sqlalchemy import DateTime, func
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.base import Base
@@ -15,17 +15,20 @@ class Conversation(Base):
     __tablename__ = "conversation"
 
     id: Mapped[int] = mapped_column(primary_key=True, init=False, autoincrement=True)
-    chatwoot_conversation_id: Mapped[str] = mapped_column(index=True)
-    dify_conversation_id: Mapped[Optional[str]] = mapped_column(default=None)
-    status: Mapped[str] = mapped_column(default="pending")
+    chatwoot_conversation_id: Mapped[str] = mapped_column(index=True, unique=True)
+    dify_conversation_id: Mapped[Optional[str]] = mapped_column(default=None, index=True, unique=True)
+    status: Mapped[str] = mapped_column(default="pending", index=True)
     assignee_id: Mapped[Optional[int]] = mapped_column(default=None)
+    # Timestamps come from the database clock; eager_defaults reads them back via RETURNING
     created_at: Mapped[datetime] = mapped_column(
-        DateTime(timezone=True), insert_default=lambda: datetime.now(UTC), nullable=False, init=False
+        DateTime(timezone=True), server_default=func.now(), nullable=False, init=False
     )
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
-        insert_default=lambda: datetime.now(UTC),
-        onupdate=lambda: datetime.now(UTC),
+        server_default=func.now(),
+        onupdate=func.now(),
         nullable=False,
         init=False,
     )
+
+    __mapper_args__ = {"eager_defaults": True}
@@ -18,6 +18,7 @@ sync_engine = create_engine(
     pool_timeout=config.DB_POOL_TIMEOUT,
     pool_recycle=config.DB_POOL_RECYCLE,
     pool_pre_ping=config.DB_POOL_PRE_PING,
+    query_cache_size=config.DB_QUERY_CACHE_SIZE,
     connect_args={"connect_timeout": 10},  # PostgreSQL specific - connect timeout in seconds
 )
 
@@ -31,11 +32,13 @@ async_engine = create_async_engine(
     pool_recycle=config.DB_POOL_RECYCLE,
     pool_pre_ping=config.DB_POOL_PRE_PING,
     pool_timeout=config.DB_POOL_TIMEOUT,
+    query_cache_size=config.DB_QUERY_CACHE_SIZE,
 )
 
 # Session makers with proper typing
-SyncSessionLocal = sessionmaker(bind=sync_engine, class_=Session)
-AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession)
+# expire_on_commit=False keeps loaded attributes usable after commit without another SELECT
+SyncSessionLocal = sessionmaker(bind=sync_engine, class_=Session, expire_on_commit=False)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
 
 
 # Sync session for Celery tasks
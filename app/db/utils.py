@@ -1,6 +1,8 @@
 """Database utilities for SQLAlchemy 2 with backward compatibility."""
 import logging
 
+from sqlalchemy import inspect
+
 # Import models to register them with the metadata
 import app.db.models  # noqa: F401
 
@@ -22,8 +24,34 @@ def create_tables():
         Base.metadata.create_all(sync_engine)
         logger.info("Database tables created successfully")
     except Exception as e:
-        logger.error(f"Failed to create database tables: {e}")
+        logger.error("Failed to create database tables: %s", e)
         raise
+    check_schema()
+
+
+def check_schema():
+    """
+    Verify that existing tables match what the models rely on.
+
+    create_all skips tables that already exist, so a database created before a schema change
+    needs its migrations applied. Without them the conversation upsert has no unique index to
+    target and inserts leave NOT NULL timestamps empty, so fail at startup instead.
+    """
+    inspector = inspect(sync_engine)
+    unique_column_sets = [index["column_names"] for index in inspector.get_indexes("conversation") if index["unique"]]
+    unique_column_sets += [
+        constraint["column_names"] for constraint in inspector.get_unique_constraints("conversation")
+    ]
+    defaults = {column["name"]: column["default"] for column in inspector.get_columns("conversation")}
+
+    problems = []
+    if ["chatwoot_conversation_id"] not in unique_column_sets:
+        problems.append("conversation.chatwoot_conversation_id has no unique index")
+    problems += [
+        f"conversation.{name} has no server default" for name in ("created_at", "updated_at") if not defaults.get(name)
+    ]
+    if problems:
+        raise RuntimeError(f"Database schema is out of date ({'; '.join(problems)}); run `alembic upgrade head`.")
 
 
 def drop_tables():
@@ -38,7 +66,7 @@ def drop_tables():
         Base.metadata.drop_all(sync_engine)
         logger.info("Database tables dropped successfully")
     except Exception as e:
-        logger.error(f"Failed to drop database tables: {e}")
+        logger.error("Failed to drop database tables: %s", e)
         raise
 
 
@@ -53,7 +81,7 @@ async def create_tables_async():
         create_tables()
         logger.info("Async table creation completed")
     except Exception as e:
-        logger.error(f"Async table creation failed: {e}")
+        logger.error("Async table creation failed: %s", e)
         raise
 
 
@@ -2,6 +2,7 @@ import logging
 import os
 
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 
 from app.api import chatwoot, health, webhooks
 from app.api.webhooks import lifespan
@@ -22,7 +23,12 @@ sentry_initialized = init_sentry(
 if sentry_initialized:
     logging.info("Sentry initialized with comprehensive integrations: FastAPI, AsyncPG, Celery, HTTPX, and SQLAlchemy")
 
-app = FastAPI(title="Chatdify", lifespan=lifespan, debug=os.getenv("DEBUG", "False") == "True")
+app = FastAPI(
+    title="Chatdify",
+    lifespan=lifespan,
+    debug=os.getenv("DEBUG", "False") == "True",
+    default_response_class=ORJSONResponse,
+)
 
 app.include_router(webhooks.router, prefix="/api/v1")
 app.include_router(health.router, prefix="/api/v1/health")
@@ -13,8 +13,10 @@ from app.schemas import (
     ConversationCreate,
     ConversationCreateRequest,
     ConversationPriority,
+    ConversationPriorityValue,
     ConversationResponse,
     ConversationStatus,
+    ConversationStatusValue,
     ConversationUpdateRequest,
     DifyResponse,
 )
@@ -35,4 +37,6 @@ __all__ = [
     "DifyResponse",
     "ConversationPriority",
     "ConversationStatus",
+    "ConversationPriorityValue",
+    "ConversationStatusValue",
 ]
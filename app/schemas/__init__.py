@@ -35,8 +35,10 @@ from app.schemas.conversation import (
     ConversationCreate,
     ConversationCreateRequest,
     ConversationPriority,
+    ConversationPriorityValue,
     ConversationResponse,
     ConversationStatus,
+    ConversationStatusValue,
     ConversationUpdateRequest,
 )
 
@@ -51,6 +53,8 @@ __all__ = [
     "ConversationUpdateRequest",
     "ConversationPriority",
     "ConversationStatus",
+    "ConversationPriorityValue",
+    "ConversationStatusValue",
     # Chatwoot schemas
     "ChatwootSender",
     "ChatwootMeta",
@@ -2,7 +2,7 @@
 
 from typing import Literal, Optional
 
-from pydantic import BaseModel, ConfigDict, Field, computed_field
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 
 from app.schemas.conversation import ConversationCreate
 
@@ -22,12 +22,13 @@ class ChatwootMeta(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     assignee: Optional[dict] = Field(default=None, description="Assignee information")
+    assignee_id: Optional[int] = Field(default=None, description="Assignee ID, taken from assignee")
 
-    @computed_field
-    @property
-    def assignee_id(self) -> Optional[int]:
-        """Extract assignee ID from assignee dictionary."""
-        return self.assignee.get("id") if self.assignee else None
+    @model_validator(mode="after")
+    def _extract_assignee_id(self) -> "ChatwootMeta":
+        # Resolved once here instead of on every access
+        self.assignee_id = (self.assignee or {}).get("id")
+        return self
 
 
 class ChatwootConversation(BaseModel):
@@ -39,12 +40,12 @@ class ChatwootConversation(BaseModel):
     status: str = Field(default="pending", description="Conversation status")
     inbox_id: Optional[int] = Field(default=None, description="Inbox ID where conversation belongs")
     meta: ChatwootMeta = Field(default_factory=ChatwootMeta, description="Conversation metadata")
+    assignee_id: Optional[int] = Field(default=None, description="Assignee ID, taken from meta")
 
-    @computed_field
-    @property
-    def assignee_id(self) -> Optional[int]:
-        """Get assignee ID from conversation metadata."""
-        return self.meta.assignee_id
+    @model_validator(mode="after")
+    def _extract_assignee_id(self) -> "ChatwootConversation":
+        self.assignee_id = self.meta.assignee_id
+        return self
 
 
 class ChatwootMessage(BaseModel):
@@ -65,6 +66,7 @@ class ChatwootWebhook(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
     event: str = Field(..., description="Webhook event type")
+    id: Optional[int] = Field(default=None, description="Message ID for message events")
     message_type: Optional[Literal["incoming", "outgoing"]] = Field(..., description="Message direction type")
     sender: Optional[ChatwootSender] = Field(default=None, description="Sender from payload root")
     message: Optional[ChatwootMessage] = Field(default=None, description="Message data")
@@ -72,51 +74,24 @@ class ChatwootWebhook(BaseModel):
     content: Optional[str] = Field(default=None, description="Content from payload root")
     echo_id: Optional[str] = Field(default=None, description="Echo ID for AI-generated message identification")
 
-    @computed_field
-    @property
-    def sender_id(self) -> Optional[int]:
-        """Get sender ID from the top-level sender field."""
-        return self.sender.id if self.sender else None
-
-    @computed_field
-    @property
-    def conversation_id(self) -> Optional[int]:
-        """Get conversation ID from either message or conversation."""
-        if self.message and self.message.conversation:
-            return self.message.conversation.id
-        elif self.conversation:
-            return self.conversation.id
-        return None
-
-    @computed_field
-    @property
-    def assignee_id(self) -> Optional[int]:
-        """Get assignee ID from conversation meta."""
-        if self.message and self.message.conversation:
-            return self.message.conversation.assignee_id
-        elif self.conversation:
-            return self.conversation.assignee_id
-        return None
-
-    @computed_field
-    @property
-    def derived_message_type(self) -> Optional[str]:
-        """Get message type from the nested message object."""
-        return self.message.message_type if self.message else None
-
-    @computed_field
-    @property
-    def status(self) -> Optional[str]:
-        """Get status from conversation."""
-        if self.conversation:
-            return self.conversation.status
-        return None
-
-    @computed_field
-    @property
-    def sender_type(self) -> Optional[str]:
-        """Get sender type."""
-        return self.sender.type if self.sender else None
+    sender_id: Optional[int] = Field(default=None, description="Sender ID, taken from sender")
+    conversation_id: Optional[int] = Field(default=None, description="Conversation ID, from message or conversation")
+    assignee_id: Optional[int] = Field(default=None, description="Assignee ID, from the conversation meta")
+    derived_message_type: Optional[str] = Field(default=None, description="Message type of the nested message")
+    status: Optional[str] = Field(default=None, description="Conversation status")
+    sender_type: Optional[str] = Field(default=None, description="Sender type, taken from sender")
+
+    @model_validator(mode="after")
+    def _derive_fields(self) -> "ChatwootWebhook":
+        # Resolved once here; handlers read these several times per request
+        conversation = self.message.conversation if self.message else self.conversation
+        self.sender_id = self.sender.id if self.sender else None
+        self.sender_type = self.sender.type if self.sender else None
+        self.conversation_id = conversation.id if conversation else None
+        self.assignee_id = conversation.assignee_id if conversation else None
+        self.derived_message_type = self.message.message_type if self.message else None
+        self.status = self.conversation.status if self.conversation else None
+        return self
 
     def to_conversation_create(self) -> ConversationCreate:
         """Convert webhook data to ConversationCreate schema."""
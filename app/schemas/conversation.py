@@ -1,7 +1,7 @@
 """Conversation-related Pydantic v2 DTO schemas."""
 from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field, computed_field
 
@@ -20,6 +20,12 @@ class ConversationStatus(str, Enum):
     OPEN = "open"
     RESOLVED = "resolved"
     PENDING = "pending"
+    SNOOZED = "snoozed"
+
+
+# Plain-value forms of the enums above, for handler signatures below the validated API boundary
+ConversationStatusValue = Literal["open", "resolved", "pending", "snoozed"]
+ConversationPriorityValue = Optional[Literal["urgent", "high", "medium", "low"]]
 
 
 class ConversationBase(BaseModel):
@@ -1,45 +1,33 @@
+import contextlib
+import functools
 import logging
-from typing import Any, Dict, Optional
+from typing import Any, Awaitable, Dict, Optional
 
 import httpx
+import orjson
+import redis
 from celery import Celery, signals
-from dotenv import load_dotenv
-from sqlalchemy import select
+from celery.exceptions import Retry
+from celery.utils.time import get_exponential_backoff_interval
+from kombu.serialization import register as register_serializer
+from sqlalchemy import or_, select, update
 
 from app import config
-from app.api.chatwoot import ChatwootHandler
-from app.config import (
-    BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL,
-    BOT_ERROR_MESSAGE_INTERNAL,
-)
+from app.api.chatwoot import get_chatwoot
+from app.api.dify import dify
+from app.config import SELF_MESSAGE_PREFIXES
 from app.db.models import Conversation
 from app.db.session import get_sync_session
 from app.schemas import DifyResponse
+from app.utils.event_loop import close_event_loop, run_async
 from app.utils.sentry import init_sentry
 
-load_dotenv()
-
-# Use timeout constants from config
-HTTPX_TIMEOUT = httpx.Timeout(
-    connect=config.HTTPX_CONNECT_TIMEOUT,
-    read=config.HTTPX_READ_TIMEOUT,
-    write=config.HTTPX_WRITE_TIMEOUT,
-    pool=config.HTTPX_POOL_TIMEOUT,
-)
-
 # Use LOG_LEVEL from config instead of directly from environment
 LOG_LEVEL = config.LOG_LEVEL
 
 REDIS_BROKER = config.REDIS_BROKER
 REDIS_BACKEND = config.REDIS_BACKEND
 
-# Configure root logger
-logging.basicConfig(
-    level=getattr(logging, LOG_LEVEL.upper()),
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    force=True,  # Override any existing configuration
-)
-
 # Ensure celery logging is properly configured
 celery_logger = logging.getLogger("celery")
 celery_logger.setLevel(getattr(logging, LOG_LEVEL.upper()))
@@ -51,10 +39,30 @@ logger.setLevel(getattr(logging, LOG_LEVEL.upper()))
 # Ensure logs are propagated up
 logger.propagate = True
 
+
+def _orjson_dumps(obj: Any) -> bytes:
+    # Celery's exception metadata can carry non-str keys; orjson rejects those by default
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+register_serializer(
+    "orjson", _orjson_dumps, orjson.loads, content_type="application/x-orjson", content_encoding="utf-8"
+)
+
 celery = Celery("tasks")
 celery.config_from_object(config, namespace="CELERY")
 
 
+# Configure the root logger once in the worker's main process; pool processes inherit it on fork.
+# Connecting this signal also stops Celery from installing its own handlers on top.
+@signals.setup_logging.connect
+def setup_logging(**_kwargs):
+    logging.basicConfig(
+        level=getattr(logging, LOG_LEVEL.upper()),
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+
 # Initialize Sentry on Celery daemon startup
 @signals.celeryd_init.connect
 def init_sentry_for_celery(**_kwargs):
@@ -81,53 +89,251 @@ def init_sentry_for_worker(**_kwargs):
         logger.info("Celery worker: Sentry initialized with Celery, HTTPX, and SQLAlchemy integrations")
 
 
-def make_dify_request(url: str, data: dict, headers: dict) -> dict:
-    """Make a request to Dify API with retry logic"""
-    with httpx.Client(timeout=HTTPX_TIMEOUT) as client:
-        response = client.post(url, json=data, headers=headers)
-        response.raise_for_status()
-        return response.json()
+# Close pooled Chatwoot and Dify connections when a pool process or the worker itself exits
+@signals.worker_process_shutdown.connect
+@signals.worker_shutdown.connect
+def close_http_clients(**_kwargs):
+    close_event_loop(get_chatwoot().aclose, dify.aclose)
 
 
 # Helper function to update conversation in DB (synchronous with SQLAlchemy 2)
-def update_conversation_dify_id_sync(chatwoot_convo_id: str, new_dify_id: str):
+def update_conversation_dify_id_sync(chatwoot_convo_id: str, new_dify_id: str, replacing: Optional[str] = None) -> bool:
     """
-    Update the dify_conversation_id for a conversation using sync SQLAlchemy 2 session.
-    
+    Set the dify_conversation_id for a conversation that doesn't have one yet, using sync SQLAlchemy 2 session.
+
+    The check and the write are one conditional UPDATE, so concurrent tasks can't both set it.
+
     Args:
         chatwoot_convo_id: The Chatwoot conversation ID to search for
         new_dify_id: The new Dify conversation ID to set
+        replacing: A stale Dify conversation ID that may be overwritten as well
+
+    Returns:
+        Whether new_dify_id was stored; False if another task set the ID first or the update failed
     """
-    logger.info(f"Attempting to update dify_conversation_id for chatwoot_convo_id={chatwoot_convo_id} to {new_dify_id}")
-    with get_sync_session() as db:  # Use synchronous session
-        try:
-            # Use SQLAlchemy 2.x select syntax for sync session
-            statement = select(Conversation).where(
-                Conversation.chatwoot_conversation_id == chatwoot_convo_id
-            )
-            result = db.execute(statement)
-            conversation = result.scalar_one_or_none()
-            
-            if conversation:
-                if not conversation.dify_conversation_id:  # Update only if it's not already set
-                    conversation.dify_conversation_id = new_dify_id
-                    # Note: get_sync_session handles commit automatically
-                    logger.info(f"Successfully updated dify_conversation_id for chatwoot_convo_id={chatwoot_convo_id}")
-                else:
-                    logger.warning(
-                        f"dify_conversation_id already set for chatwoot_convo_id={chatwoot_convo_id}. Skipping update."
+    logger.info(
+        "Attempting to update dify_conversation_id for chatwoot_convo_id=%s to %s", chatwoot_convo_id, new_dify_id
+    )
+    try:
+        with get_sync_session() as db:  # Commits on exit, rolls back on exception
+            updated = db.execute(
+                update(Conversation)
+                .where(
+                    Conversation.chatwoot_conversation_id == chatwoot_convo_id,
+                    or_(
+                        Conversation.dify_conversation_id.is_(None),
+                        Conversation.dify_conversation_id == replacing,
                     )
-            else:
-                logger.error(
-                    f"Conversation record not found for chatwoot_conversation_id={chatwoot_convo_id} "
-                    f"during update attempt."
+                    if replacing
+                    else Conversation.dify_conversation_id.is_(None),
+                )
+                .values(dify_conversation_id=new_dify_id)
+            ).rowcount
+            # Only a no-op update needs a second look, to tell a missing record from an already set id
+            exists = (
+                bool(updated)
+                or db.execute(
+                    select(Conversation.id).where(Conversation.chatwoot_conversation_id == chatwoot_convo_id)
+                ).first()
+                is not None
+            )
+    except Exception as e:
+        logger.error(
+            "Failed to update dify_conversation_id for chatwoot_convo_id=%s: %s", chatwoot_convo_id, e, exc_info=True
+        )
+        return False
+
+    if updated:
+        logger.info("Successfully updated dify_conversation_id for chatwoot_convo_id=%s", chatwoot_convo_id)
+    elif exists:
+        logger.warning("dify_conversation_id already set for chatwoot_convo_id=%s. Skipping update.", chatwoot_convo_id)
+    else:
+        logger.error(
+            "Conversation record not found for chatwoot_conversation_id=%s during update attempt.", chatwoot_convo_id
+        )
+    return bool(updated)
+
+
+def get_conversation_dify_id_sync(chatwoot_convo_id: str) -> Optional[str]:
+    """Read the stored dify_conversation_id for a Chatwoot conversation; None if there is none or the read fails."""
+    try:
+        with get_sync_session() as db:
+            return db.scalar(
+                select(Conversation.dify_conversation_id).where(
+                    Conversation.chatwoot_conversation_id == chatwoot_convo_id
+                )
+            )
+    except Exception as e:
+        logger.error(
+            "Failed to read dify_conversation_id for chatwoot_convo_id=%s: %s", chatwoot_convo_id, e, exc_info=True
+        )
+        return None
+
+
+@functools.lru_cache(maxsize=1)
+def _get_redis() -> redis.Redis:
+    # redis-py resets its pool after a fork, so one client per module is safe under prefork
+    return redis.Redis.from_url(config.REDIS_BACKEND, socket_timeout=1.0, socket_connect_timeout=1.0)
+
+
+def _claim_message(chatwoot_conversation_id: Optional[str], message_id: int, task_id: str) -> bool:
+    """Record task_id as the handler of a Chatwoot message; False if another task already claimed it.
+
+    Retries and redeliveries of the same task keep its claim. If Redis is unreachable the message is processed.
+    """
+    key = f"chatwoot-dify:message:{chatwoot_conversation_id}:{message_id}"
+    try:
+        client = _get_redis()
+        if client.set(key, task_id, nx=True, ex=config.MESSAGE_DEDUP_TTL_SECONDS):
+            return True
+        owner = client.get(key)
+    except redis.RedisError as e:
+        logger.warning("Message deduplication unavailable, processing message %s anyway: %s", message_id, e)
+        return True
+    return owner is None or owner.decode() == task_id
+
+
+def _dead_conversation_key(dify_conversation_id: str) -> str:
+    return f"chatwoot-dify:dify-dead:{dify_conversation_id}"
+
+
+def _mark_conversation_dead(dify_conversation_id: str) -> None:
+    """Remember that Dify no longer knows a conversation, so queued messages for it skip the doomed call."""
+    try:
+        _get_redis().set(_dead_conversation_key(dify_conversation_id), 1, ex=config.DIFY_DEAD_CONVERSATION_TTL_SECONDS)
+    except redis.RedisError as e:
+        logger.warning("Could not record dead Dify conversation %s: %s", dify_conversation_id, e)
+
+
+def _is_conversation_dead(dify_conversation_id: str) -> bool:
+    try:
+        return bool(_get_redis().exists(_dead_conversation_key(dify_conversation_id)))
+    except redis.RedisError as e:
+        logger.warning("Could not check dead Dify conversation %s: %s", dify_conversation_id, e)
+        return False
+
+
+def _discard_conversation(dify_conversation_id: str) -> None:
+    # Best effort; the client already logs a failed deletion
+    with contextlib.suppress(Exception):
+        run_async(dify.delete_conversation(dify_conversation_id))
+
+
+def _live_dify_id(chatwoot_conversation_id: Optional[str], stale_dify_id: str) -> Optional[str]:
+    """The Dify conversation stored in place of a stale one, so the reply keeps its history.
+
+    None when nothing else is stored or the stored conversation is known to be gone as well.
+    """
+    if not chatwoot_conversation_id:
+        return None
+    stored = get_conversation_dify_id_sync(chatwoot_conversation_id)
+    if not stored or stored == stale_dify_id or _is_conversation_dead(stored):
+        return None
+    return stored
+
+
+def _is_not_found(e: Exception) -> bool:
+    return isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 404
+
+
+async def _outcome(coro: Awaitable[Any]) -> Any:
+    # The result, or the exception instead of raising it, like gather(return_exceptions=True) for one call
+    try:
+        return await coro
+    except Exception as e:
+        return e
+
+
+def open_conversation_after_error(chatwoot_conversation_id: str, previous_status: Optional[str], reason: str) -> None:
+    """Hand a conversation over to operators after a failure; errors are logged, never raised.
+
+    The status is opened before the public message goes out, so agents see the conversation as theirs by the time
+    the customer is told about it. A failed toggle doesn't stop the message.
+    """
+    logger.info("Setting Chatwoot conversation %s status to 'open' due to %s", chatwoot_conversation_id, reason)
+    try:
+        chatwoot = get_chatwoot()
+        conversation_id = int(chatwoot_conversation_id)
+        toggle_result = run_async(
+            _outcome(
+                chatwoot.toggle_status(
+                    conversation_id=conversation_id,
+                    status="open",
+                    previous_status=previous_status,
+                    is_error_transition=True,  # Indicate this is an error-induced transition
+                )
+            )
+        )
+        message_result = run_async(
+            _outcome(
+                chatwoot.send_message(
+                    conversation_id=conversation_id,
+                    message=config.BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL,
+                    private=False,
                 )
-        except Exception as e:
-            logger.error(
-                f"Failed to update dify_conversation_id for chatwoot_convo_id={chatwoot_convo_id}: {e}",
-                exc_info=True,
             )
-            # Note: get_sync_session handles rollback automatically on exception
+        )
+    except Exception as e:
+        logger.error("Failed to hand conversation %s over to operators (%s): %s", chatwoot_conversation_id, reason, e)
+        return
+
+    if isinstance(toggle_result, Exception):
+        logger.error(
+            "Failed to set conversation %s status to 'open' (%s): %s", chatwoot_conversation_id, reason, toggle_result
+        )
+    else:
+        logger.info("Successfully set conversation %s status to 'open' (%s)", chatwoot_conversation_id, reason)
+    if isinstance(message_result, Exception):
+        logger.error(
+            "Failed to send external error message to conversation %s: %s", chatwoot_conversation_id, message_result
+        )
+
+
+async def _set_typing(chatwoot_conversation_id: int, typing_on: bool) -> None:
+    # The indicator is cosmetic; failures are already logged by the handler
+    with contextlib.suppress(Exception):
+        await get_chatwoot().toggle_typing_status(chatwoot_conversation_id, typing_on)
+
+
+async def _ask_dify(
+    message: str, inputs: Dict[str, Any], dify_conversation_id: Optional[str], chatwoot_conversation_id: Optional[str]
+) -> Dict[str, Any]:
+    """Send a message to Dify; while a streamed answer is generated, Chatwoot shows the bot as typing."""
+    if not chatwoot_conversation_id or config.DIFY_RESPONSE_MODE != "streaming":
+        return await dify.send_chat_message(query=message, inputs=inputs, conversation_id=dify_conversation_id)
+
+    conversation_id = int(chatwoot_conversation_id)
+    typing = False
+
+    async def start_typing() -> None:
+        nonlocal typing
+        typing = True
+        await _set_typing(conversation_id, True)
+
+    try:
+        return await dify.send_chat_message(
+            query=message, inputs=inputs, conversation_id=dify_conversation_id, on_first_token=start_typing
+        )
+    finally:
+        if typing:
+            await _set_typing(conversation_id, False)
+
+
+class _MissingConversationId(RuntimeError):
+    """Dify answered the first message of a conversation without a conversation_id."""
+
+
+def _is_retryable(e: Exception) -> bool:
+    """Whether another attempt may succeed: a Dify 500 or a missing conversation id."""
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 500
+    return isinstance(e, _MissingConversationId)
+
+
+def _describe_error(e: Exception) -> str:
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"Dify HTTP {e.response.status_code}"
+    return f"{type(e).__name__}: {e}"
 
 
 @celery.task(bind=True, max_retries=3, default_retry_delay=5)
@@ -138,241 +344,174 @@ def process_message_with_dify(
     chatwoot_conversation_id: Optional[str] = None,
     conversation_status: Optional[str] = None,
     message_type: Optional[str] = None,  # `incoming` and `outgoing`
+    message_id: Optional[int] = None,
 ) -> Dict[str, Any]:
     """
-    Process a message with Dify and return the response as a dictionary.
+    Process a message with Dify, post the answer to the Chatwoot conversation and return the response as a dictionary.
     Handles initial conversation creation if dify_conversation_id is None.
-    Retries on 404 if an existing dify_conversation_id is provided but not found.
+    If Dify no longer knows an existing dify_conversation_id, a new conversation replaces it.
     """
     # Prevent bot from replying to its own error or status messages
-    if message.startswith(BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL) or message.startswith(BOT_ERROR_MESSAGE_INTERNAL):
-        logger.info(f"Skipping self-generated message: {message[:50]}...")
+    if message.startswith(SELF_MESSAGE_PREFIXES):
+        logger.info("Skipping self-generated message: %.50s...", message)
         return {"status": "skipped", "reason": "agent_bot message"}
-    url = f"{config.DIFY_API_URL}/chat-messages"
-    headers = {
-        "Authorization": f"Bearer {config.DIFY_API_KEY}",
-        "Content-Type": "application/json",
-    }
+
+    # Chatwoot retries webhooks it considers failed; a second task for the same message must not reach Dify
+    if (
+        message_id is not None
+        and config.MESSAGE_DEDUP_TTL_SECONDS > 0
+        and not _claim_message(chatwoot_conversation_id, message_id, self.request.id or "")
+    ):
+        logger.info(
+            "Skipping duplicate delivery of message %s in conversation %s", message_id, chatwoot_conversation_id
+        )
+        return {"status": "skipped", "reason": "duplicate message"}
 
     logger.info(
-        f"Processing message with Dify for chatwoot_conversation_id={chatwoot_conversation_id}, "
-        f"dify_conversation_id={dify_conversation_id}, direction: {message_type}"
+        "Processing message with Dify for chatwoot_conversation_id=%s, dify_conversation_id=%s, direction: %s",
+        chatwoot_conversation_id,
+        dify_conversation_id,
+        message_type,
     )
-    data = {
-        "query": message,
-        "inputs": {
-            "chatwoot_conversation_id": chatwoot_conversation_id,
-            "conversation_status": conversation_status,
-            "message_direction": message_type,
-        },
-        "response_mode": config.DIFY_RESPONSE_MODE,
-        "user": "user",
+    inputs = {
+        "chatwoot_conversation_id": chatwoot_conversation_id,
+        "conversation_status": conversation_status,
+        "message_direction": message_type,
     }
 
+    # A conversation Dify already reported as gone is replaced right away instead of failing again.
+    # Another task may already have stored its replacement; only start a new one if not.
+    stale_dify_id = None
+    if dify_conversation_id and _is_conversation_dead(dify_conversation_id):
+        stale_dify_id = dify_conversation_id
+        dify_conversation_id = _live_dify_id(chatwoot_conversation_id, stale_dify_id)
+        logger.info(
+            "Dify conversation %s is known to be gone, continuing in %s.",
+            stale_dify_id,
+            dify_conversation_id or "a new conversation",
+        )
+
     # Only include conversation_id in the payload if it's already set
     if dify_conversation_id:
-        data["conversation_id"] = dify_conversation_id
         logger.info("Using existing dify_conversation_id.")
     else:
         logger.info("No dify_conversation_id provided. Attempting to create conversation via first message.")
         # Payload for creation doesn't include 'conversation_id' key
 
     try:
-        with httpx.Client(timeout=HTTPX_TIMEOUT) as client:
-            response = client.post(url, json=data, headers=headers)
-            # Store response content before raising exception
-            if response.status_code >= 400:
-                error_content = response.text
-                logger.error(f"Dify API error response ({response.status_code}): {error_content}")
-            response.raise_for_status()  # Raise exception for 4xx/5xx
-            result = response.json()
-            logger.info(f"Dify API success for chatwoot_conversation_id={chatwoot_conversation_id}")
-
-            # --- Handle Conversation Creation ---
-            # If we started without an ID, extract the new one from the response and update DB
-            if not dify_conversation_id and chatwoot_conversation_id:
-                new_dify_id = result.get("conversation_id")
-                if new_dify_id:
-                    logger.info(f"New Dify conversation created: {new_dify_id}. Updating database.")
-                    # Update DB synchronously within the task
-                    update_conversation_dify_id_sync(chatwoot_conversation_id, new_dify_id)
-                else:
-                    # --- MODIFIED: Error log and retry ---
-                    error_msg = (
-                        f"Dify API call succeeded (status {response.status_code}) but didn't return a 'conversation_id'"
-                        f"when one was expected (initial creation for chatwoot_convo_id={chatwoot_conversation_id}). "
-                        f"Dify response: {result}"
-                    )
-                    logger.error(error_msg)
-                    # Retry the task, maybe it was a temporary glitch in Dify returning the ID
-                    try:
-                        logger.warning(
-                            f"Retrying task due to missing conversation_id on creation "
-                            f"(attempt {self.request.retries + 1}/{self.max_retries})..."
-                        )
-                        # Using default retry delay configured for the task
-                        self.retry(
-                            exc=RuntimeError(error_msg),
-                            countdown=config.CELERY_RETRY_COUNTDOWN,
-                        )
-                    except self.MaxRetriesExceededError:
-                        logger.error(
-                            f"Max retries exceeded for missing conversation_id on creation for "
-                            f"chatwoot_convo_id={chatwoot_conversation_id}. Failing task.",
-                            exc_info=True,
-                        )
-                        # Fall through to generic error handling below by raising the original error
-                        raise RuntimeError(error_msg) from None  # Reraise to trigger final error handling
-                    # --- END MODIFICATION ---
-            # --- End Handle Conversation Creation ---
-
-            return result  # Return successful result (contains first message answer)
-
-    except httpx.HTTPStatusError as e:
-        # first handle internal server error with retrying celery task
-        if e.response.status_code == 500:
+        # DifyClient logs the error body and raises HTTPStatusError for 4xx/5xx
+        try:
+            result = run_async(_ask_dify(message, inputs, dify_conversation_id, chatwoot_conversation_id))
+        except httpx.HTTPStatusError as e:
+            # Retrying a conversation Dify doesn't know can't succeed; start a new one in the same attempt
+            if not (_is_not_found(e) and dify_conversation_id):
+                raise
+            _mark_conversation_dead(dify_conversation_id)
+            stale_dify_id = dify_conversation_id
+            dify_conversation_id = _live_dify_id(chatwoot_conversation_id, stale_dify_id)
             logger.warning(
-                f"Dify 500 (Internal Server Error) for chatwoot_conversation_id={chatwoot_conversation_id}. "
-                f"Retrying task (attempt {self.request.retries + 1}/{self.max_retries})..."
+                "Dify conversation %s not found for chatwoot_conversation_id=%s, continuing in %s.",
+                stale_dify_id,
+                chatwoot_conversation_id,
+                dify_conversation_id or "a new conversation",
             )
-            try:
-                # Use Celery's retry mechanism with countdown
-                self.retry(exc=e, countdown=config.CELERY_RETRY_COUNTDOWN)  # Use configured countdown
-            except self.MaxRetriesExceededError:
+            result = run_async(_ask_dify(message, inputs, dify_conversation_id, chatwoot_conversation_id))
+        logger.info("Dify API success for chatwoot_conversation_id=%s", chatwoot_conversation_id)
+
+        # --- Handle Conversation Creation ---
+        # If we started without an ID, extract the new one from the response and update DB
+        if not dify_conversation_id and chatwoot_conversation_id:
+            new_dify_id = result.get("conversation_id")
+            if new_dify_id:
+                logger.info("New Dify conversation created: %s. Updating database.", new_dify_id)
+                # Update DB synchronously within the task
+                if not update_conversation_dify_id_sync(chatwoot_conversation_id, new_dify_id, replacing=stale_dify_id):
+                    # Another task recorded its conversation first. Answer from that one so the reply has its
+                    # history, and drop the new conversation, which nothing will ever reference.
+                    winner_dify_id = stale_dify_id and _live_dify_id(chatwoot_conversation_id, stale_dify_id)
+                    if winner_dify_id:
+                        logger.info(
+                            "Dify conversation %s was stored first for chatwoot_conversation_id=%s, asking it instead.",
+                            winner_dify_id,
+                            chatwoot_conversation_id,
+                        )
+                        _discard_conversation(new_dify_id)
+                        result = run_async(_ask_dify(message, inputs, winner_dify_id, chatwoot_conversation_id))
+            else:
+                # The response is logged once here; the exception stays short since it is logged again below
                 logger.error(
-                    f"Max retries exceeded for Dify 500 on conversation {chatwoot_conversation_id}. Failing task.",
-                    exc_info=True,
+                    "Dify API call succeeded but didn't return a 'conversation_id' when one was expected "
+                    "(initial creation for chatwoot_convo_id=%s). Dify response: %s",
+                    chatwoot_conversation_id,
+                    result,
                 )
-                # Fall through to generic error handling (set status to open, etc.)
-
-        # then handle 404 errors
-        # Specific retry logic for 404 ONLY when a conversation ID WAS provided
-        if e.response.status_code == 404 and dify_conversation_id:
-            logger.warning(
-                f"Dify 404 (Conversation Not Found) for *existing* dify_id={dify_conversation_id}. "
-                f"Retrying task (attempt {self.request.retries + 1}/{self.max_retries})..."
-            )
-            try:
-                # Use Celery's retry mechanism with countdown
-                self.retry(exc=e, countdown=config.CELERY_RETRY_COUNTDOWN)  # Use configured countdown
-            except self.MaxRetriesExceededError:
-                logger.error(
-                    f"Max retries exceeded for Dify 404 on conversation {dify_conversation_id}. Failing task.",
-                    exc_info=True,
+                # Retry the task, maybe it was a temporary glitch in Dify returning the ID
+                raise _MissingConversationId(
+                    f"Dify returned no conversation_id for chatwoot_convo_id={chatwoot_conversation_id}"
                 )
-                # Fall through to generic error handling (set status to open, etc.)
-        # If it was a 404 but dify_conversation_id was None, it means creation failed - don't retry.
-        elif e.response.status_code == 404 and not dify_conversation_id:
-            logger.error(
-                f"Dify returned 404 when attempting initial conversation creation."
-                f"Payload: {data}. Response: {e.response.text}",
-                exc_info=True,
-            )
-            # Fall through to generic error handling
-        
-        # Log other HTTP errors before falling through
-        elif isinstance(e, httpx.HTTPStatusError):
-            logger.error(
-                f"HTTP Error {e.response.status_code} processing Dify message: {e.response.text}",
-                exc_info=True,
-            )
-            # Fall through to generic error handling
-
-        # Generic error handling for non-retryable errors or max retries exceeded
-        logger.critical(
-            f"Critical error processing message with Dify: {e} \n"
-            f"conversation_id: {dify_conversation_id} \n chatwoot_conversation_id: {chatwoot_conversation_id}",
-            exc_info=True,
-        )
-        # If it's an HTTP error, try to extract and log the response content again (might be redundant but safe)
-        if isinstance(e, httpx.HTTPStatusError) and hasattr(e, "response"):
-            logger.error(f"Final Response content on failure: {e.response.text}")
+        # --- End Handle Conversation Creation ---
 
-        # Set conversation status to open on error
-        if chatwoot_conversation_id:
-            try:
-                logger.info(f"Setting Chatwoot conversation {chatwoot_conversation_id} status to 'open' due to error")
-                chatwoot = ChatwootHandler()
-                current_status_before_toggle = conversation_status
-                # Set status to open, indicating it's an error transition for internal note
-                chatwoot.toggle_status_sync(
-                    conversation_id=int(chatwoot_conversation_id),
-                    status="open",
-                    previous_status=current_status_before_toggle,
-                    is_error_transition=True,  # Indicate this is an error-induced transition
-                )
-                logger.info(f"Successfully set conversation {chatwoot_conversation_id} status to 'open' (HTTP error)")
-
-                # Send public error message to the user
-                logger.info(f"Sending external error message to conversation {chatwoot_conversation_id}")
-                chatwoot.send_message_sync(
-                    conversation_id=int(chatwoot_conversation_id),
-                    message=config.BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL,
-                    private=False,
+    except Retry:
+        raise
+    except Exception as e:
+        if _is_retryable(e):
+            if self.request.retries < self.max_retries:
+                logger.warning(
+                    "Retrying Dify call for chatwoot_conversation_id=%s after %s (attempt %d/%d)...",
+                    chatwoot_conversation_id,
+                    _describe_error(e),
+                    self.request.retries + 1,
+                    self.max_retries,
                 )
-
-            except Exception as status_error:
-                logger.error(
-                    f"Failed to set conversation {chatwoot_conversation_id} status to 'open'"
-                    f"or send error messages: {status_error}"
+                # Jittered backoff keeps workers from retrying in lockstep while Dify recovers
+                countdown = get_exponential_backoff_interval(
+                    factor=config.CELERY_RETRY_COUNTDOWN,
+                    retries=self.request.retries,
+                    maximum=config.CELERY_RETRY_BACKOFF_MAX,
+                    full_jitter=True,
                 )
+                raise self.retry(exc=e, countdown=countdown) from e
+            logger.error(
+                "Max retries exceeded for chatwoot_conversation_id=%s (%s). Failing task.",
+                chatwoot_conversation_id,
+                _describe_error(e),
+            )
 
-        raise e from e
-
-    except Exception as e:  # Catch other non-HTTP errors
+        is_http_error = isinstance(e, httpx.HTTPStatusError)
+        # One traceback per failure; retries above are expected and logged without one
         logger.critical(
-            f"Non-HTTP critical error processing message with Dify: {e} \n"
-            f"conversation_id: {dify_conversation_id} \n "
-            f"chatwoot_conversation_id: {chatwoot_conversation_id}",
+            "Failed to process message with Dify for chatwoot_conversation_id=%s, dify_conversation_id=%s: %s\n"
+            "Response content: %s",
+            chatwoot_conversation_id,
+            dify_conversation_id,
+            _describe_error(e),
+            e.response.text if is_http_error else "",
             exc_info=True,
         )
         # Set conversation status to open on error and send messages
         if chatwoot_conversation_id:
-            try:
-                logger.info(
-                    f"Setting Chatwoot conversation {chatwoot_conversation_id} status to 'open' due to non-HTTP error"
-                )
-                chatwoot = ChatwootHandler()
-                current_status_before_toggle = conversation_status
-                # Set status to open, indicating it's an error transition for internal note
-                chatwoot.toggle_status_sync(
-                    conversation_id=int(chatwoot_conversation_id),
-                    status="open",
-                    previous_status=current_status_before_toggle,
-                    is_error_transition=True,  # Indicate this is an error-induced transition
-                )
-                logger.info(
-                    f"Successfully set conversation {chatwoot_conversation_id} status to 'open' (non-HTTP error)"
-                )
-
-                # Send public error message to the user
-                logger.info(f"Sending external error message to conversation {chatwoot_conversation_id}")
-                chatwoot.send_message_sync(
-                    conversation_id=int(chatwoot_conversation_id),
-                    message=config.BOT_CONVERSATION_OPENED_MESSAGE_EXTERNAL,
-                    private=False,
-                )
-            except Exception as status_error:
-                logger.error(
-                    f"Failed to set conversation {chatwoot_conversation_id} status to 'open' or"
-                    f"send error messages (non-HTTP error): {status_error}"
-                )
+            open_conversation_after_error(
+                chatwoot_conversation_id, conversation_status, "HTTP error" if is_http_error else "non-HTTP error"
+            )
+        raise
 
-        raise e from e
+    # Reply from this task instead of a linked callback task, saving a broker round trip. This is outside
+    # the try above so that a failed Chatwoot post fails the task without retrying the Dify call.
+    if chatwoot_conversation_id:
+        send_dify_answer(result, int(chatwoot_conversation_id))
+    return result  # Return successful result (contains first message answer)
 
 
-@celery.task(name="app.tasks.handle_dify_response")
-def handle_dify_response(dify_result: Dict[str, Any], conversation_id: int):
-    """Handle the response from Dify"""
-
-    chatwoot = ChatwootHandler()
+def send_dify_answer(dify_result: Dict[str, Any], conversation_id: int) -> None:
+    """Post a Dify answer to the Chatwoot conversation, skipping empty answers."""
+    chatwoot = get_chatwoot()
 
     # No need to update conversation here anymore, it's done in process_message_with_dify if needed.
     # We still need the DifyResponse model for validation/extraction.
     try:
         dify_response_data = DifyResponse.model_validate(dify_result)
 
-        # Send message back to Chatwoot. Sync is okay because we use separate instance of ChatwootHandler
+        # Send message back to Chatwoot. Sync is okay because Celery workers run outside the API event loop
         if dify_response_data.has_valid_answer():
             chatwoot.send_message_sync(
                 conversation_id=conversation_id,
@@ -381,44 +520,41 @@ def handle_dify_response(dify_result: Dict[str, Any], conversation_id: int):
             )
         else:
             logger.info(
-                f"Dify response for conversation_id {conversation_id} had an empty or whitespace-only answer. "
-                f"Raw response: {dify_result}. Skipping sending message to Chatwoot."
+                "Dify response for conversation_id %s had an empty or whitespace-only answer. "
+                "Raw response: %s. Skipping sending message to Chatwoot.",
+                conversation_id,
+                dify_result,
             )
     except Exception as e:
-        logger.error(f"Error handling Dify response: {str(e)}", exc_info=True)
+        logger.error("Error handling Dify response: %s", e, exc_info=True)
         # Re-raise to ensure Celery knows this task failed
         raise
 
 
+@celery.task(name="app.tasks.handle_dify_response")
+def handle_dify_response(dify_result: Dict[str, Any], conversation_id: int):
+    """Handle the response from Dify
+
+    process_message_with_dify now replies itself; this task stays registered for callbacks
+    linked before that change that are still queued.
+    """
+    send_dify_answer(dify_result, conversation_id)
+
+
 @celery.task(name="app.tasks.handle_dify_error")
 def handle_dify_error(request: Dict[str, Any], exc: Exception, traceback: str, conversation_id: int):
     """Handle any errors from the Dify task"""
     # The import 'from .api.chatwoot import ChatwootHandler' and associated message sending logic
     # have been removed as per new requirements. Only logging remains.
 
-    logger.error(f"Dify task failed for conversation {conversation_id}: {exc} \n {request} \n {traceback}")
+    logger.error("Dify task failed for conversation %s: %s \n %s \n %s", conversation_id, exc, request, traceback)
 
 
 @celery.task(name="app.tasks.delete_dify_conversation")
 def delete_dify_conversation(dify_conversation_id: str):
     """Delete a conversation from Dify when it's deleted in Chatwoot"""
-    logger.info(f"Deleting Dify conversation: {dify_conversation_id}")
-
-    url = f"{config.DIFY_API_URL}/conversations/{dify_conversation_id}"
-    headers = {
-        "Authorization": f"Bearer {config.DIFY_API_KEY}",
-        "Content-Type": "application/json",
-    }
+    logger.info("Deleting Dify conversation: %s", dify_conversation_id)
 
-    try:
-        with httpx.Client(timeout=HTTPX_TIMEOUT) as client:
-            response = client.delete(url, headers=headers)
-            response.raise_for_status()
-            logger.info(f"Successfully deleted Dify conversation: {dify_conversation_id}")
-            return {"status": "success", "conversation_id": dify_conversation_id}
-    except Exception as e:
-        logger.error(
-            f"Failed to delete Dify conversation {dify_conversation_id}: {e}",
-            exc_info=True,
-        )
-        raise e from e
+    # DifyClient.delete_conversation logs both success and failure
+    run_async(dify.delete_conversation(dify_conversation_id))
+    return {"status": "success", "conversation_id": dify_conversation_id}
@@ -61,7 +61,7 @@ def handle_api_errors(operation_name: str):
 
             except ValueError as e:
                 # Validation errors
-                logger.error(f"Validation error in {operation_name}: {e}", exc_info=True)
+                logger.error("Validation error in %s: %s", operation_name, e, exc_info=True)
                 raise HTTPException(
                     status_code=422,
                     detail={"error": "Validation error", "operation": operation_name, "message": str(e)},
@@ -69,7 +69,7 @@ def handle_api_errors(operation_name: str):
 
             except Exception as e:
                 # Database transaction errors and other unexpected errors
-                logger.error(f"Unexpected error in {operation_name}: {e}", exc_info=True)
+                logger.error("Unexpected error in %s: %s", operation_name, e, exc_info=True)
 
                 # The six-line pattern handles database rollbacks automatically
                 raise HTTPException(
@@ -166,12 +166,12 @@ def handle_validation_error(error: Exception, operation: str, field: Optional[st
 
 def log_operation_start(operation: str, **context) -> None:
     """Log the start of an operation with context."""
-    logger.info(f"Starting {operation}", extra=context)
+    logger.info("Starting %s", operation, extra=context)
 
 
 def log_operation_success(operation: str, **context) -> None:
     """Log successful completion of an operation."""
-    logger.info(f"Successfully completed {operation}", extra=context)
+    logger.info("Successfully completed %s", operation, extra=context)
 
 
 def log_operation_error(operation: str, error: Exception, **context) -> None:
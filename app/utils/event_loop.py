@@ -0,0 +1,32 @@
+"""
+Persistent event loop for running async code from synchronous callers such as Celery tasks.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Coroutine, TypeVar
+
+T = TypeVar("T")
+
+# One loop per process, kept for its lifetime: the shared async clients are bound to the loop
+# they were created on, so reusing it keeps their pooled connections between calls
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine to completion on this process's persistent event loop.
+
+    Must not be called while an event loop is running in the current thread.
+    """
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
+
+
+def close_event_loop(*cleanups: Callable[[], Awaitable[Any]]) -> None:
+    """Await the cleanup callables on the persistent loop, then close it; no-op if it never started."""
+    if _loop is None or _loop.is_closed():
+        return
+    for cleanup in cleanups:
+        _loop.run_until_complete(cleanup())
+    _loop.close()
@@ -0,0 +1,56 @@
+"""
+Shared HTTP helpers for the Chatwoot and Dify clients.
+"""
+
+import asyncio
+import ssl
+from typing import Any, Callable
+
+import certifi
+import httpx
+import orjson
+
+# Building an SSLContext parses the CA bundle, so do it once and share it with every client
+SSL_CONTEXT = ssl.create_default_context(cafile=certifi.where())
+
+
+def dump_json(obj: Any) -> bytes:
+    """Serialize a request body; callers rely on their client headers for Content-Type."""
+    return orjson.dumps(obj)
+
+
+def load_json(response: httpx.Response) -> Any:
+    """Parse a response body with orjson; Response.json() goes through the stdlib json module."""
+    return orjson.loads(response.content)
+
+
+class LoopBoundClient:
+    """Lazily built httpx.AsyncClient that is rebuilt when used from another event loop.
+
+    Pooled connections belong to the loop that opened them, so a module-level client must not
+    be reused across loops (e.g. separate asyncio.run calls or per-test loops).
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncClient]):
+        self._factory = factory
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def get(self) -> httpx.AsyncClient:
+        """Return the client for the running loop, building it on first use."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._client = self._factory()
+            self._loop = loop
+        return self._client
+
+    def set(self, client: httpx.AsyncClient) -> None:
+        """Use the given client for the running loop (e.g. one with a mock transport)."""
+        self._client = client
+        self._loop = asyncio.get_running_loop()
+
+    async def aclose(self) -> None:
+        """Close the client if it belongs to the running loop; otherwise just drop it."""
+        client, self._client = self._client, None
+        if client is not None and self._loop is asyncio.get_running_loop():
+            await client.aclose()
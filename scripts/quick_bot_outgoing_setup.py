@@ -44,49 +44,23 @@ def load_environment():
     
     return config
 
-def get_current_bot_info(config):
-    """Fetch current bot information"""
-    url = f"{config['CHATWOOT_INSTANCE_URL']}/api/v1/accounts/2/agent_bots/{config['AGENT_BOT_ID']}"
-    headers = {
+def create_session(config):
+    """Create a session that keeps one connection to Chatwoot for all calls"""
+    session = requests.Session()
+    session.headers.update({
         'api_access_token': config['CHATWOOT_SUPER_ADMIN_TOKEN'],
         'Content-Type': 'application/json'
-    }
-    
-    print(f"DEBUG: GET URL: {url}")
-    
-    try:
-        response = requests.get(url, headers=headers)
-        print(f"DEBUG: Response status: {response.status_code}")
-        print(f"DEBUG: Response headers: {dict(response.headers)}")
-        
-        if response.status_code == 200:
-            try:
-                return response.json()
-            except json.JSONDecodeError as e:
-                print(f"Error parsing JSON response: {e}")
-                print(f"Raw response: {response.text[:500]}")
-                return None
-        else:
-            print(f"HTTP Error: {response.status_code}")
-            print(f"Response content: {response.text[:500]}")
-            return None
-            
-    except requests.exceptions.RequestException as e:
-        print(f"Request error: {e}")
-        return None
+    })
+    return session
 
-def list_all_bots(config):
+def list_all_bots(session, config):
     """List all agent bots to help debug"""
     url = f"{config['CHATWOOT_INSTANCE_URL']}/api/v1/accounts/2/agent_bots"
-    headers = {
-        'api_access_token': config['CHATWOOT_SUPER_ADMIN_TOKEN'],
-        'Content-Type': 'application/json'
-    }
     
     print(f"DEBUG: LIST URL: {url}")
     
     try:
-        response = requests.get(url, headers=headers)
+        response = session.get(url)
         print(f"DEBUG: List response status: {response.status_code}")
         
         if response.status_code == 200:
@@ -109,13 +83,9 @@ def list_all_bots(config):
         print(f"Request error: {e}")
         return None
 
-def update_bot_webhook_url(config):
+def update_bot_webhook_url(session, config):
     """Update the agent bot's outgoing webhook URL"""
     url = f"{config['CHATWOOT_INSTANCE_URL']}/api/v1/accounts/2/agent_bots/{config['AGENT_BOT_ID']}"
-    headers = {
-        'api_access_token': config['CHATWOOT_SUPER_ADMIN_TOKEN'],
-        'Content-Type': 'application/json'
-    }
     
     payload = {
         'outgoing_url': config['NEW_OUTGOING_URL']
@@ -125,7 +95,7 @@ def update_bot_webhook_url(config):
     print(f"DEBUG: Payload: {json.dumps(payload, indent=2)}")
     
     try:
-        response = requests.put(url, headers=headers, json=payload)
+        response = session.put(url, json=payload)
         print(f"DEBUG: Response status: {response.status_code}")
         print(f"DEBUG: Response headers: {dict(response.headers)}")
         
@@ -158,9 +128,11 @@ def main():
     print(f"New Outgoing URL: {config['NEW_OUTGOING_URL']}")
     print()
     
+    session = create_session(config)
+
     # First, list all bots to see what's available
     print("Listing all available bots...")
-    bots = list_all_bots(config)
+    bots = list_all_bots(session, config)
     
     if not bots:
         print("Failed to list bots. Check your API token and permissions.")
@@ -188,7 +160,7 @@ def main():
     
     # Update the webhook URL
     print("\nUpdating bot webhook URL...")
-    result = update_bot_webhook_url(config)
+    result = update_bot_webhook_url(session, config)
     
     if result:
         new_url = result.get('outgoing_url', 'Unknown')
@@ -1,13 +1,18 @@
 import asyncio
+import functools
+import os
+import random
+import string
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import AsyncGenerator
 from unittest.mock import AsyncMock
 
 import httpx
 import pytest
 import pytest_asyncio
-from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession, create_async_engine
 from sqlalchemy.pool import StaticPool
 
 from app.api.chatwoot import ChatwootHandler
@@ -27,12 +32,25 @@ from app.schemas import (
     ConversationCreate,
 )
 
-# Load environment variables
-load_dotenv()
+# .env is loaded once by app.config, imported above
+
+# Fixtures that create conversations on a live Chatwoot; tests using them are marked `chatwoot`
+_LIVE_CHATWOOT_FIXTURES = frozenset({"new_chatwoot_conversation", "shared_chatwoot_conversation", "chatwoot_test_env"})
+
+
+def pytest_collection_modifyitems(config, items):
+    """Mark tests needing a live Chatwoot and skip them unless RUN_CHATWOOT is set."""
+    run_chatwoot = bool(os.environ.get("RUN_CHATWOOT"))
+    skip_chatwoot = pytest.mark.skip(reason="needs a live Chatwoot; set RUN_CHATWOOT=1")
+    for item in items:
+        if _LIVE_CHATWOOT_FIXTURES.intersection(getattr(item, "fixturenames", ())):
+            item.add_marker(pytest.mark.chatwoot)
+        if not run_chatwoot and item.get_closest_marker("chatwoot"):
+            item.add_marker(skip_chatwoot)
 
 
 # Create an in-memory async database for testing
-@pytest_asyncio.fixture(scope="session")
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
 async def test_async_engine():
     """Create async test engine with in-memory SQLite database."""
     engine = create_async_engine(
@@ -41,11 +59,26 @@ async def test_async_engine():
         poolclass=StaticPool,
         echo=False,  # Set to True for SQL debugging
     )
+
+    # Let SQLAlchemy emit BEGIN itself so the per-test SAVEPOINTs in async_session work with sqlite
+    @event.listens_for(engine.sync_engine, "connect")
+    def _disable_pysqlite_transactions(dbapi_connection, _record):
+        dbapi_connection.isolation_level = None
+        # An in-memory database already journals in memory; keep temp tables there too and skip syncs
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _emit_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
     yield engine
     await engine.dispose()
 
 
-@pytest_asyncio.fixture(scope="session")
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
 async def create_tables(test_async_engine):
     """Create all database tables for testing."""
     # Import models to register them with metadata
@@ -54,31 +87,37 @@ async def create_tables(test_async_engine):
     async with test_async_engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
+    # No drop_all: the in-memory database goes away when test_async_engine is disposed
     yield
 
-    # Clean up after tests
-    async with test_async_engine.begin() as conn:
-        await conn.run_sync(Base.metadata.drop_all)
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def db_connection(test_async_engine, create_tables) -> AsyncGenerator[AsyncConnection, None]:
+    """One connection for the whole run, inside an outer transaction that is never committed."""
+    async with test_async_engine.connect() as connection:
+        trans = await connection.begin()
+        yield connection
+        if trans.is_active:
+            await trans.rollback()
 
 
 @pytest_asyncio.fixture
-async def async_session(test_async_engine, create_tables) -> AsyncGenerator[AsyncSession, None]:
+async def async_session(db_connection) -> AsyncGenerator[AsyncSession, None]:
     """
     Provide async database session for tests with proper transaction handling.
-    Each test gets a fresh transaction that is rolled back after the test.
+    Each test runs inside a SAVEPOINT that is rolled back after the test.
     """
-    async with AsyncSession(test_async_engine) as session:
-        # Start a transaction
-        trans = await session.begin()
-        try:
-            yield session
-        finally:
-            # Always rollback to ensure test isolation
-            # Check if transaction is still active before rolling back
-            if trans.is_active:
-                await trans.rollback()
-            # Close the session
-            await session.close()
+    savepoint = await db_connection.begin_nested()
+    # Session commits only release savepoints nested inside the test's own. Like the app's sessions, objects
+    # stay loaded after a commit; server defaults come back from the INSERT's RETURNING clause.
+    session = AsyncSession(bind=db_connection, join_transaction_mode="create_savepoint", expire_on_commit=False)
+    try:
+        yield session
+    finally:
+        # Always rollback to ensure test isolation, even if the test committed
+        await session.close()
+        if savepoint.is_active:
+            await savepoint.rollback()
 
 
 @pytest.fixture
@@ -91,8 +130,25 @@ def chatwoot_handler():
     )
 
 
+@pytest_asyncio.fixture
+async def chatwoot_transport(chatwoot_handler):
+    """
+    Route chatwoot_handler's requests to a stand-in server.
+    Call it with a request -> response function (sync or async); the client is closed after the test.
+    """
+
+    def install(respond) -> ChatwootHandler:
+        chatwoot_handler._client = httpx.AsyncClient(
+            base_url=chatwoot_handler.account_url, transport=httpx.MockTransport(respond)
+        )
+        return chatwoot_handler
+
+    yield install
+    await chatwoot_handler.aclose()
+
+
 # Test data factories
-@pytest.fixture
+@pytest.fixture(scope="session")
 def conversation_factory():
     """Factory for creating test Conversation models."""
 
@@ -114,7 +170,7 @@ def conversation_factory():
     return _create_conversation
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def conversation_create_factory():
     """Factory for creating ConversationCreate Pydantic schemas."""
 
@@ -136,7 +192,7 @@ def conversation_create_factory():
     return _create_conversation_create
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def chatwoot_webhook_factory():
     """Factory for creating ChatwootWebhook test data."""
 
@@ -145,27 +201,27 @@ def chatwoot_webhook_factory():
         message_type: str = "incoming",
         content: str = "Test message",
         conversation_id: int = 123,
-        sender_id: int = 456,
+        sender_id: int | None = 456,
+        assignee_id: int | None = None,
         **kwargs,
     ) -> ChatwootWebhook:
+        assignee = {"id": assignee_id} if assignee_id is not None else None
         return ChatwootWebhook(
             event=event,
             message_type=message_type,
             content=content,
-            sender=ChatwootSender(id=sender_id, type="contact"),
-            conversation=ChatwootConversation(id=conversation_id, status="pending", meta=ChatwootMeta(assignee=None)),
+            sender=ChatwootSender(id=sender_id, type="contact") if sender_id is not None else None,
+            conversation=ChatwootConversation(
+                id=conversation_id, status="pending", meta=ChatwootMeta(assignee=assignee)
+            ),
             **kwargs,
         )
 
     return _create_webhook
 
 
-@pytest.fixture
-def mock_chatwoot_handler():
-    """Create a mock ChatwootHandler for testing without external API calls."""
-    handler = AsyncMock(spec=ChatwootHandler)
-
-    # Configure common mock responses
+def _configure_mock_chatwoot_handler(handler: AsyncMock) -> None:
+    """Set the canned responses shared by tests that mock the Chatwoot API."""
     handler.get_teams.return_value = [{"id": 1, "name": "Test Team"}]
     handler.send_message.return_value = {"id": 123, "content": "Test response"}
     handler.get_conversation_data.return_value = {
@@ -180,6 +236,22 @@ def mock_chatwoot_handler():
     handler.update_custom_attributes.return_value = {"status": "success"}
     handler.toggle_priority.return_value = {"status": "success"}
 
+
+@pytest.fixture(scope="session")
+def _session_mock_chatwoot_handler():
+    # Building a spec'd AsyncMock introspects the whole handler class, so it is done once
+    handler = AsyncMock(spec=ChatwootHandler)
+    _configure_mock_chatwoot_handler(handler)
+    return handler
+
+
+@pytest.fixture
+def mock_chatwoot_handler(_session_mock_chatwoot_handler):
+    """Create a mock ChatwootHandler for testing without external API calls."""
+    handler = _session_mock_chatwoot_handler
+    # Drop calls, return values and side effects set by the previous test
+    handler.reset_mock(return_value=True, side_effect=True)
+    _configure_mock_chatwoot_handler(handler)
     return handler
 
 
@@ -187,27 +259,32 @@ def mock_chatwoot_handler():
 async def wait_for_service():
     """Fixture to wait for a service to be available with proper async handling."""
 
-    async def _wait(check_func, timeout=5, interval=2):
+    async def _wait(check_func, timeout=5, max_interval=1.0):
         """
         Wait for a service to be available
 
         Args:
             check_func: Async function that returns True if service is available
             timeout: Maximum time to wait in seconds
-            interval: Time between checks in seconds
+            max_interval: Upper bound in seconds for the delay between checks, which doubles from 50ms
 
         Returns:
             True if service became available, False if timeout was reached
         """
-        start_time = asyncio.get_event_loop().time()
-        while (asyncio.get_event_loop().time() - start_time) < timeout:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delay = 0.05
+        while True:
             try:
                 if await check_func():
                     return True
             except Exception:
                 pass
-            await asyncio.sleep(interval)
-        return False
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, max_interval)
 
     return _wait
 
@@ -219,7 +296,6 @@ async def sample_conversation(async_session: AsyncSession, conversation_factory)
     conversation = conversation_factory(chatwoot_conversation_id="test_123", status="pending")
     async_session.add(conversation)
     await async_session.commit()
-    await async_session.refresh(conversation)
     return conversation
 
 
@@ -232,25 +308,28 @@ async def multiple_conversations(async_session: AsyncSession, conversation_facto
         conversation_factory(chatwoot_conversation_id="conv_3", status="resolved"),
     ]
 
-    for conv in conversations:
-        async_session.add(conv)
-
+    async_session.add_all(conversations)
     await async_session.commit()
+    return conversations
 
-    for conv in conversations:
-        await async_session.refresh(conv)
 
-    return conversations
+# --- Chatwoot HTTP Client ---
+@functools.lru_cache(maxsize=1)
+def _chatwoot_http_client() -> httpx.Client:
+    """Shared client for the Chatwoot setup helpers, so their requests reuse keep-alive connections."""
+    return httpx.Client(timeout=20.0, headers={"Content-Type": "application/json"})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if _chatwoot_http_client.cache_info().currsize:
+        _chatwoot_http_client().close()
 
 
 # --- Chatwoot Inbox Fetch Helper ---
+@functools.lru_cache(maxsize=1)  # The inbox doesn't change during a run; failures aren't cached
 def get_first_chatwoot_inbox_id() -> int:
     url = f"{CHATWOOT_API_URL}/accounts/{CHATWOOT_ACCOUNT_ID}/inboxes"
-    headers = {
-        "api_access_token": CHATWOOT_ADMIN_API_KEY,
-        "Content-Type": "application/json",
-    }
-    response = httpx.get(url, headers=headers)
+    response = _chatwoot_http_client().get(url, headers={"api_access_token": CHATWOOT_ADMIN_API_KEY})
     response.raise_for_status()
     inboxes = response.json().get("payload", [])
     if not inboxes:
@@ -261,11 +340,11 @@ def get_first_chatwoot_inbox_id() -> int:
 # --- Chatwoot Conversation Creation Fixture ---
 
 
-def _generate_random_string(length=8):
-    import random
-    import string
+_RANDOM_ALPHABET = string.ascii_lowercase + string.digits
+
 
-    return "".join(random.choices(string.ascii_lowercase + string.digits, k=length))
+def _generate_random_string(length=8):
+    return "".join(random.choices(_RANDOM_ALPHABET, k=length))
 
 
 def get_or_create_chatwoot_contact(email: str, name: str) -> int:
@@ -290,9 +369,10 @@ def get_or_create_chatwoot_contact(email: str, name: str) -> int:
     return contact_id
 
 
-def create_chatwoot_conversation(contact_id: int, source_id: str) -> int:
+def create_chatwoot_conversation(contact_id: int, source_id: str, inbox_id: int | None = None) -> int:
     url = f"{CHATWOOT_API_URL}/accounts/{CHATWOOT_ACCOUNT_ID}/conversations"
-    inbox_id = get_first_chatwoot_inbox_id()
+    if inbox_id is None:
+        inbox_id = get_first_chatwoot_inbox_id()
     payload = {
         "inbox_id": inbox_id,
         "contact_id": contact_id,
@@ -311,38 +391,60 @@ def create_chatwoot_conversation(contact_id: int, source_id: str) -> int:
 def delete_chatwoot_conversation(conversation_id: int):
     url = f"{CHATWOOT_API_URL}/accounts/{CHATWOOT_ACCOUNT_ID}/conversations/{conversation_id}"
     try:
-        with httpx.Client(timeout=20.0) as client:
-            headers = {
-                "api_access_token": CHATWOOT_ADMIN_API_KEY,
-                "Content-Type": "application/json",
-            }
-            client.delete(url, headers=headers)
+        _chatwoot_http_client().delete(url, headers={"api_access_token": CHATWOOT_ADMIN_API_KEY})
     except Exception:
         pass
 
 
 def _make_chatwoot_request(method: str, url: str, is_admin: bool = True, **kwargs):
     key = CHATWOOT_ADMIN_API_KEY if is_admin else CHATWOOT_API_KEY
-    headers = {"api_access_token": key, "Content-Type": "application/json"}
     for _ in range(3):
         try:
-            with httpx.Client(timeout=20.0) as client:
-                response = client.request(method, url, headers=headers, **kwargs)
-                response.raise_for_status()
-                return response
+            response = _chatwoot_http_client().request(method, url, headers={"api_access_token": key}, **kwargs)
+            response.raise_for_status()
+            return response
         except Exception:
             time.sleep(2)
     raise Exception(f"Failed Chatwoot request: {method} {url}")
 
 
-@pytest.fixture(scope="function")
-def new_chatwoot_conversation() -> int:
+@pytest.fixture(scope="session")
+def _chatwoot_conversations_to_delete():
+    """Collect test conversations and delete them together once the run is over."""
+    conversation_ids: list[int] = []
+    yield conversation_ids
+    if conversation_ids:
+        # One settle period for the whole run, so bot replies still in flight land before the deletes
+        time.sleep(5)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(delete_chatwoot_conversation, conversation_ids))
+
+
+@pytest_asyncio.fixture(scope="function")
+async def new_chatwoot_conversation(_chatwoot_conversations_to_delete) -> int:
     unique_id = _generate_random_string(8)
     contact_email = f"test-contact-{unique_id}@example.com"
     contact_name = f"Test Contact {unique_id}"
     source_id = f"test-source-{unique_id}"
-    contact_id = get_or_create_chatwoot_contact(email=contact_email, name=contact_name)
-    conversation_id = create_chatwoot_conversation(contact_id=contact_id, source_id=source_id)
-    yield conversation_id
-    time.sleep(5)
-    delete_chatwoot_conversation(conversation_id)
+    # The inbox lookup and the contact setup are independent, so their requests overlap
+    inbox_id, contact_id = await asyncio.gather(
+        asyncio.to_thread(get_first_chatwoot_inbox_id),
+        asyncio.to_thread(get_or_create_chatwoot_contact, email=contact_email, name=contact_name),
+    )
+    conversation_id = await asyncio.to_thread(
+        create_chatwoot_conversation, contact_id=contact_id, source_id=source_id, inbox_id=inbox_id
+    )
+    _chatwoot_conversations_to_delete.append(conversation_id)
+    return conversation_id
+
+
+@pytest.fixture(scope="module")
+def shared_chatwoot_conversation(_chatwoot_conversations_to_delete) -> int:
+    """One live conversation for a module's tests; each test must undo its changes or only add to it."""
+    unique_id = _generate_random_string(8)
+    contact_id = get_or_create_chatwoot_contact(
+        email=f"test-contact-{unique_id}@example.com", name=f"Test Contact {unique_id}"
+    )
+    conversation_id = create_chatwoot_conversation(contact_id=contact_id, source_id=f"test-source-{unique_id}")
+    _chatwoot_conversations_to_delete.append(conversation_id)
+    return conversation_id
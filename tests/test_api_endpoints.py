@@ -4,15 +4,12 @@ from unittest.mock import AsyncMock, patch
 import httpx
 import pytest
 import pytest_asyncio
-from dotenv import load_dotenv
 from fastapi.testclient import TestClient
 
 from app.db.session import get_session
 from app.main import app
 from app.schemas import ConversationResponse
 
-load_dotenv()
-
 # API base URL - get from environment or use default
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000/api/v1")
 
@@ -180,6 +177,23 @@ async def test_conversation_creation_endpoint(test_client, conversation_create_f
     assert conversation_response.id is not None
 
 
+async def test_webhook_skips_bot_messages_before_validation(test_client):
+    """Bot echoes are skipped from the raw payload, without full webhook validation."""
+    payload = {
+        "event": "message_created",
+        "message_type": "outgoing",
+        "content": "Bot reply",
+        "sender": {"id": 1, "type": "agent_bot"},
+    }
+
+    with patch("app.api.webhooks.ChatwootWebhook.model_validate") as model_validate:
+        response = test_client.post("/api/v1/chatwoot-webhook", json=payload)
+
+    assert response.status_code == 200
+    assert response.json() == {"status": "skipped", "reason": "agent_bot message"}
+    model_validate.assert_not_called()
+
+
 async def test_conversation_retrieval_endpoint(test_client, sample_conversation):
     """Test retrieving a conversation via API endpoint."""
     response = test_client.get(f"/api/v1/chatwoot/conversations/{sample_conversation.chatwoot_conversation_id}")
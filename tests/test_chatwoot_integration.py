@@ -1,6 +1,9 @@
+import asyncio
 import random
 import string
+import threading
 from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import AsyncMock
 
 import httpx
@@ -13,11 +16,15 @@ from app.api.chatwoot import ChatwootHandler
 pytestmark = pytest.mark.asyncio
 
 
+_RANDOM_ALPHABET = string.ascii_letters + string.digits
+
+
 # Helper function to generate random strings for testing
 def random_string(length=10):
-    return "".join(random.choices(string.ascii_letters + string.digits, k=length))
+    return "".join(random.choices(_RANDOM_ALPHABET, k=length))
 
 
+@pytest.mark.chatwoot
 async def test_chatwoot_connection(chatwoot_handler, wait_for_service):
     """Test that we can connect to Chatwoot."""
 
@@ -42,14 +49,14 @@ async def test_chatwoot_connection_with_mock(mock_chatwoot_handler):
     assert teams[0]["name"] == "Test Team"
 
 
-async def test_send_message(chatwoot_handler, new_chatwoot_conversation):
+async def test_send_message(chatwoot_handler, shared_chatwoot_conversation):
     """Test sending a message to a conversation."""
     message = (
         f"Test message {random_string()} at {datetime.now(timezone.utc).isoformat()} - "
         "Acknowledge receiving by saying `I see a test message`"
     )
     result = await chatwoot_handler.send_message(
-        conversation_id=new_chatwoot_conversation, message=message, private=True
+        conversation_id=shared_chatwoot_conversation, message=message, private=True
     )
     assert result is not None
     assert "id" in result, "Expected response to contain message ID"
@@ -65,17 +72,17 @@ async def test_send_message_with_mock(mock_chatwoot_handler):
     assert result["content"] == "Test response"
 
 
-async def test_update_conversation_status(chatwoot_handler, new_chatwoot_conversation):
+async def test_update_conversation_status(chatwoot_handler, shared_chatwoot_conversation):
     """Test updating conversation status."""
-    conversation_data = await chatwoot_handler.get_conversation_data(new_chatwoot_conversation)
+    conversation_data = await chatwoot_handler.get_conversation_data(shared_chatwoot_conversation)
     original_status = conversation_data.get("status", "open")
     new_status = "resolved" if original_status != "resolved" else "open"
-    result = await chatwoot_handler.toggle_status(conversation_id=new_chatwoot_conversation, status=new_status)
+    result = await chatwoot_handler.toggle_status(conversation_id=shared_chatwoot_conversation, status=new_status)
     print("toggle_status response:", result)
     assert result["payload"]["success"] is True
-    updated_conversation = await chatwoot_handler.get_conversation_data(new_chatwoot_conversation)
+    updated_conversation = await chatwoot_handler.get_conversation_data(shared_chatwoot_conversation)
     assert updated_conversation["status"] == new_status
-    await chatwoot_handler.toggle_status(conversation_id=new_chatwoot_conversation, status=original_status)
+    await chatwoot_handler.toggle_status(conversation_id=shared_chatwoot_conversation, status=original_status)
 
 
 async def test_update_conversation_status_with_mock(mock_chatwoot_handler):
@@ -88,13 +95,13 @@ async def test_update_conversation_status_with_mock(mock_chatwoot_handler):
     assert result["status"] == "success"
 
 
-async def test_add_labels(chatwoot_handler, new_chatwoot_conversation):
+async def test_add_labels(chatwoot_handler, shared_chatwoot_conversation):
     """Test adding labels to a conversation."""
     test_label = "test_label"
-    result = await chatwoot_handler.add_labels(conversation_id=new_chatwoot_conversation, labels=[test_label])
+    result = await chatwoot_handler.add_labels(conversation_id=shared_chatwoot_conversation, labels=[test_label])
     print("add_labels response:", result)
     assert isinstance(result.get("payload"), list)
-    conversation_data = await chatwoot_handler.get_conversation_data(new_chatwoot_conversation)
+    conversation_data = await chatwoot_handler.get_conversation_data(shared_chatwoot_conversation)
     assert test_label in conversation_data.get("labels", [])
 
 
@@ -113,17 +120,17 @@ async def test_add_labels_with_mock(mock_chatwoot_handler):
     assert test_label in conversation_data["labels"]
 
 
-async def test_update_custom_attributes(chatwoot_handler, new_chatwoot_conversation):
+async def test_update_custom_attributes(chatwoot_handler, shared_chatwoot_conversation):
     """Test updating custom attributes."""
     test_attribute_key = f"test_attr_{random_string(5)}"
     test_attribute_value = f"value_{random_string(5)}"
     result = await chatwoot_handler.update_custom_attributes(
-        conversation_id=new_chatwoot_conversation,
+        conversation_id=shared_chatwoot_conversation,
         custom_attributes={test_attribute_key: test_attribute_value},
     )
     print("update_custom_attributes response:", result)
     assert "custom_attributes" in result
-    conversation_data = await chatwoot_handler.get_conversation_data(new_chatwoot_conversation)
+    conversation_data = await chatwoot_handler.get_conversation_data(shared_chatwoot_conversation)
     assert conversation_data["custom_attributes"].get(test_attribute_key) == test_attribute_value
 
 
@@ -146,17 +153,17 @@ async def test_update_custom_attributes_with_mock(mock_chatwoot_handler):
     assert conversation_data["custom_attributes"][test_key] == test_value
 
 
-async def test_toggle_priority(chatwoot_handler, new_chatwoot_conversation):
+async def test_toggle_priority(chatwoot_handler, shared_chatwoot_conversation):
     """Test toggling priority of a conversation."""
-    conversation_data = await chatwoot_handler.get_conversation_data(new_chatwoot_conversation)
+    conversation_data = await chatwoot_handler.get_conversation_data(shared_chatwoot_conversation)
     original_priority = conversation_data.get("priority", "medium")
     new_priority = "high" if original_priority != "high" else "medium"
-    result = await chatwoot_handler.toggle_priority(conversation_id=new_chatwoot_conversation, priority=new_priority)
+    result = await chatwoot_handler.toggle_priority(conversation_id=shared_chatwoot_conversation, priority=new_priority)
     print("toggle_priority response:", result)
     assert result == {}  # Empty dict means success
-    updated_conversation = await chatwoot_handler.get_conversation_data(new_chatwoot_conversation)
+    updated_conversation = await chatwoot_handler.get_conversation_data(shared_chatwoot_conversation)
     assert updated_conversation["priority"] == new_priority
-    await chatwoot_handler.toggle_priority(conversation_id=new_chatwoot_conversation, priority=original_priority)
+    await chatwoot_handler.toggle_priority(conversation_id=shared_chatwoot_conversation, priority=original_priority)
 
 
 async def test_toggle_priority_with_mock(mock_chatwoot_handler):
@@ -172,6 +179,213 @@ async def test_toggle_priority_with_mock(mock_chatwoot_handler):
     assert result["status"] == "success"
 
 
+async def test_team_name_lookup_is_cached(chatwoot_handler):
+    """Test that repeated team name lookups reuse the cached team map."""
+    chatwoot_handler.get_teams = AsyncMock(return_value=[{"id": 7, "name": "Support"}])
+
+    assert await chatwoot_handler._team_name_to_id("support") == 7
+    assert await chatwoot_handler._team_name_to_id("SUPPORT") == 7
+    assert await chatwoot_handler._team_name_to_id("unknown") == 0
+    chatwoot_handler.get_teams.assert_awaited_once()
+
+
+async def test_get_teams_is_cached_until_forced(chatwoot_handler, chatwoot_transport):
+    """Test that get_teams reuses a fetched list and max_age=0 forces a refetch."""
+    requests = []
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"payload": [{"id": 7, "name": "Support"}]})
+
+    chatwoot_transport(respond)
+
+    assert await chatwoot_handler.get_teams() == [{"id": 7, "name": "Support"}]
+    assert await chatwoot_handler.get_teams() == [{"id": 7, "name": "Support"}]
+    assert len(requests) == 1
+    await chatwoot_handler.get_teams(max_age=0)
+    assert len(requests) == 2
+
+
+async def test_error_transition_only_toggles_status(chatwoot_handler, chatwoot_transport):
+    """Test that an error-induced open transition posts the status change and nothing else."""
+    requests = []
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(200, json={"payload": {"success": True}})
+
+    chatwoot_transport(respond)
+
+    result = await chatwoot_handler.toggle_status(
+        conversation_id=123, status="open", previous_status="pending", is_error_transition=True
+    )
+
+    assert result == {"payload": {"success": True}}
+    assert [request.url.path.rsplit("/", 1)[-1] for request in requests] == ["toggle_status"]
+
+
+async def test_unparsed_mutation_skips_body(chatwoot_handler, chatwoot_transport):
+    """Test that parse_response=False returns None and still raises on errors."""
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/labels"):
+            return httpx.Response(500, text="broken")
+        return httpx.Response(200, json={"payload": {"success": True}})
+
+    chatwoot_transport(respond)
+
+    assert await chatwoot_handler.toggle_status(123, "open", parse_response=False) is None
+    with pytest.raises(httpx.HTTPStatusError) as exc_info:
+        await chatwoot_handler.add_labels(123, ["x"], parse_response=False)
+    assert exc_info.value.response.text == "broken"
+
+
+async def test_unparsed_mutations_reuse_the_connection():
+    """Test that HTTP/1.1 keep-alive survives calls whose reply is not parsed."""
+    client_ports = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            client_ports.append(self.client_address[1])
+            self.rfile.read(int(self.headers["Content-Length"]))
+            body = b'{"payload": {"success": true}}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    handler = ChatwootHandler(api_url=f"http://127.0.0.1:{server.server_port}/api/v1", api_key="x", account_id="1")
+    try:
+        for typing_on in (True, False, True):
+            await handler.toggle_typing_status(123, typing_on)
+        await handler.add_labels(123, ["x"], parse_response=False)
+    finally:
+        await handler.aclose()
+        server.shutdown()
+        server.server_close()
+
+    assert len(client_ports) == 4
+    assert len(set(client_ports)) == 1
+
+
+async def test_unchanged_custom_attributes_are_not_resent(chatwoot_handler, chatwoot_transport):
+    """Test that repeating the last sent custom attributes skips the request until they change or fail."""
+    statuses = iter([200, 500, 200])
+    requests = []
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(next(statuses), json={})
+
+    chatwoot_transport(respond)
+
+    await chatwoot_handler.update_custom_attributes(123, {"a": 1, "b": [1, 2]})
+    assert await chatwoot_handler.update_custom_attributes(123, {"b": [1, 2], "a": 1}) == {"skipped": True}
+    with pytest.raises(httpx.HTTPStatusError):
+        await chatwoot_handler.update_custom_attributes(123, {"a": 2})
+    # The failed update cleared the remembered value, so the original attributes go out again
+    await chatwoot_handler.update_custom_attributes(123, {"a": 1, "b": [1, 2]})
+
+    assert len(requests) == 3
+
+
+async def test_overloaded_calls_are_retried_and_shrink_the_limit(chatwoot_handler, chatwoot_transport):
+    """Test that 429/503 responses are retried after Retry-After and halve the concurrency limit."""
+    statuses = iter([429, 503, 200])
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(next(statuses), json={}, headers={"Retry-After": "0"})
+
+    chatwoot_transport(respond)
+
+    assert await chatwoot_handler.add_labels(123, ["urgent"]) == {}
+    assert chatwoot_handler._limiter.limit < chatwoot_handler._limiter.max_limit / 2
+
+
+async def test_mutations_serialize_per_conversation(chatwoot_handler, chatwoot_transport):
+    """Test that writes to one conversation run one at a time while other conversations run alongside."""
+    in_flight: dict[str, int] = {}
+    peak: dict[str, int] = {}
+
+    async def respond(request: httpx.Request) -> httpx.Response:
+        conversation = request.url.path.split("/")[-2]
+        in_flight[conversation] = in_flight.get(conversation, 0) + 1
+        peak[conversation] = max(peak.get(conversation, 0), in_flight[conversation])
+        peak["all"] = max(peak.get("all", 0), sum(in_flight.values()))
+        await asyncio.sleep(0.01)
+        in_flight[conversation] -= 1
+        return httpx.Response(200, json={})
+
+    chatwoot_transport(respond)
+
+    await asyncio.gather(
+        chatwoot_handler.add_labels(1, ["a"]),
+        chatwoot_handler.toggle_priority(1, "high"),
+        chatwoot_handler.add_labels(2, ["b"]),
+        chatwoot_handler.toggle_priority(2, "low"),
+    )
+
+    assert peak["1"] == 1 and peak["2"] == 1
+    assert peak["all"] == 2
+    assert chatwoot_handler._conversation_locks == {}
+
+
+async def test_conversation_list_fetches_all_pages(chatwoot_handler, chatwoot_transport):
+    """Test that all_pages=True fans out to the remaining pages from the meta count."""
+
+    def respond(request: httpx.Request) -> httpx.Response:
+        page = int(request.url.params.get("page", 1))
+        payload = [{"id": page * 100 + i} for i in range(25 if page < 3 else 10)]
+        return httpx.Response(200, json={"data": {"meta": {"all_count": 60}, "payload": payload}})
+
+    chatwoot_transport(respond)
+
+    conversations = await chatwoot_handler.get_conversation_list(all_pages=True)
+
+    assert len(conversations) == 60
+    assert conversations[-1]["id"] == 309
+
+
+async def test_send_message_batches_within_window():
+    """Test that public replies inside the batch window are posted as one message."""
+    handler = ChatwootHandler(
+        api_url="http://chatwoot.test/api/v1", api_key="x", account_id="1", send_batch_window_ms=20
+    )
+    handler._post_message = AsyncMock(return_value={"id": 1})
+
+    results = await asyncio.gather(
+        handler.send_message(123, "first"),
+        handler.send_message(123, "second"),
+        handler.send_message(123, "note", private=True),
+    )
+
+    assert results == [{"id": 1}] * 3
+    assert handler._post_message.await_count == 2
+    handler._post_message.assert_any_await(123, "first\n\nsecond")
+    await handler.aclose()
+
+
+async def test_bulk_helpers_keep_order(chatwoot_handler):
+    """Test that bulk helpers fan out the single-call methods and preserve order."""
+    chatwoot_handler.send_message = AsyncMock(side_effect=lambda cid, message, **kw: {"content": message})
+    chatwoot_handler.add_labels = AsyncMock(side_effect=lambda cid, labels: {"payload": labels})
+
+    sent = await chatwoot_handler.send_messages(123, [{"message": "a"}, {"message": "b", "private": True}])
+    labelled = await chatwoot_handler.add_labels_bulk({1: ["x"], 2: ["y"]})
+
+    assert [m["content"] for m in sent] == ["a", "b"]
+    assert labelled == {1: {"payload": ["x"]}, 2: {"payload": ["y"]}}
+
+
+@pytest.mark.chatwoot
 async def test_error_handling_invalid_conversation_id(chatwoot_handler):
     """Test error handling when using invalid conversation ID."""
 
@@ -193,32 +407,33 @@ async def test_error_handling_with_mock():
     assert "Conversation not found" in str(exc_info.value)
 
 
-async def test_webhook_payload_validation(chatwoot_webhook_factory):
-    """Test webhook payload validation with Pydantic v2 schemas."""
-    # Test valid webhook payload
+@pytest.mark.parametrize(
+    "conversation_id,sender_id,assignee_id",
+    [
+        pytest.param(123, 456, None, id="unassigned"),
+        pytest.param(124, 456, 789, id="assigned"),
+        pytest.param(125, None, None, id="no-sender"),
+    ],
+)
+async def test_webhook_payload(chatwoot_webhook_factory, conversation_id, sender_id, assignee_id):
+    """Test webhook payload validation and computed fields with Pydantic v2 schemas."""
     webhook = chatwoot_webhook_factory(
         event="message_created",
         message_type="incoming",
         content="Test message",
-        conversation_id=123,
-        sender_id=456,
+        conversation_id=conversation_id,
+        sender_id=sender_id,
+        assignee_id=assignee_id,
     )
 
     assert webhook.event == "message_created"
     assert webhook.message_type == "incoming"
     assert webhook.content == "Test message"
-    assert webhook.conversation_id == 123
-    assert webhook.sender_id == 456
-
-
-async def test_webhook_payload_computed_fields(chatwoot_webhook_factory):
-    """Test webhook payload computed fields work correctly."""
-    webhook = chatwoot_webhook_factory(conversation_id=123, sender_id=456)
-
-    # Test computed fields
-    assert webhook.conversation_id == 123
-    assert webhook.sender_id == 456
-    assert webhook.assignee_id is None  # Should be None based on factory default
+    # Computed fields
+    assert webhook.conversation_id == conversation_id
+    assert webhook.sender_id == sender_id
+    assert webhook.assignee_id == assignee_id
+    assert webhook.sender_type == ("contact" if sender_id is not None else None)
 
 
 async def test_database_integration_with_chatwoot_data(
@@ -234,7 +449,6 @@ async def test_database_integration_with_chatwoot_data(
     # Add to database
     async_session.add(conversation)
     await async_session.commit()
-    await async_session.refresh(conversation)
 
     # Verify database entry
     assert conversation.id is not None
@@ -253,7 +467,6 @@ async def test_chatwoot_handler_with_database_operations(
     )
     async_session.add(conversation)
     await async_session.commit()
-    await async_session.refresh(conversation)
 
     # Mock Chatwoot operations
     mock_chatwoot_handler.toggle_status.return_value = {"status": "success"}
@@ -266,7 +479,6 @@ async def test_chatwoot_handler_with_database_operations(
     # Update database
     conversation.status = "open"
     await async_session.commit()
-    await async_session.refresh(conversation)  # Refresh after commit
 
     # Verify both operations
     assert chatwoot_result["status"] == "success"
@@ -278,23 +490,15 @@ async def test_bulk_conversation_processing(async_session: AsyncSession, convers
     # Create multiple conversations
     conversations = [conversation_factory(chatwoot_conversation_id=f"conv_{i}", status="pending") for i in range(3)]
 
-    for conv in conversations:
-        async_session.add(conv)
+    async_session.add_all(conversations)
     await async_session.commit()
 
-    # Refresh all objects to avoid lazy loading issues
-    for conv in conversations:
-        await async_session.refresh(conv)
-
     # Mock bulk operations
     mock_chatwoot_handler.get_conversation_data.return_value = {"status": "processed"}
 
     # Process all conversations - access chatwoot_conversation_id early to avoid lazy loading
     conv_ids = [conv.chatwoot_conversation_id for conv in conversations]
-    results = []
-    for conv_id in conv_ids:
-        result = await mock_chatwoot_handler.get_conversation_data(conv_id)
-        results.append(result)
+    results = await asyncio.gather(*(mock_chatwoot_handler.get_conversation_data(conv_id) for conv_id in conv_ids))
 
     # Verify all operations succeeded
     assert len(results) == 3
@@ -0,0 +1,49 @@
+import json
+from unittest.mock import AsyncMock
+
+import httpx
+import pytest
+
+from app.api.dify import DifyBatchDeleter, DifyClient
+
+# Mark all tests in this file as requiring the event loop
+pytestmark = pytest.mark.asyncio
+
+
+async def test_batch_deleter_flushes_queued_ids_on_close():
+    """Test that queued deletions are all issued before the deleter stops."""
+    client = AsyncMock(spec=DifyClient)
+    client.delete_conversation.side_effect = [None, RuntimeError("gone"), None]
+    deleter = DifyBatchDeleter(client, interval=0.01)
+
+    for conversation_id in ("a", "b", "c"):
+        deleter.enqueue(conversation_id)
+    await deleter.aclose()
+
+    deleted = [call.args[0] for call in client.delete_conversation.await_args_list]
+    assert deleted == ["a", "b", "c"]
+
+
+async def test_streaming_mode_collects_answer_chunks():
+    """Test that streamed events are folded into a blocking-style response."""
+    events = [
+        {"event": "message", "conversation_id": "c1", "message_id": "m1", "answer": "Hel"},
+        {"event": "ping"},
+        {"event": "message", "conversation_id": "c1", "message_id": "m1", "answer": "lo"},
+        {"event": "message_end", "conversation_id": "c1", "message_id": "m1", "metadata": {"usage": {}}},
+    ]
+    body = "".join(f"data: {json.dumps(event)}\n\n" for event in events)
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        assert json.loads(request.content)["response_mode"] == "streaming"
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    client = DifyClient(api_url="https://dify.test/v1", api_key="key")
+    client._clients.set(httpx.AsyncClient(base_url=client.api_url, transport=httpx.MockTransport(handler)))
+
+    result = await client.send_chat_message("Hi", inputs={}, response_mode="streaming")
+    await client.aclose()
+
+    assert result["answer"] == "Hello"
+    assert result["conversation_id"] == "c1"
+    assert result["metadata"] == {"usage": {}}
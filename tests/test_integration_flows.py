@@ -6,16 +6,17 @@ from typing import Any, Dict, List, Optional
 
 import httpx
 import pytest
-from dotenv import load_dotenv
+from sqlalchemy import create_engine, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.pool import StaticPool
 
 from app import config
 from app.api.chatwoot import ChatwootHandler
+from app.api.webhooks import get_or_create_conversation
+from app.db import utils as db_utils
 from app.db.models import Conversation
 from app.schemas import ConversationCreate
 
-load_dotenv()
-
 # --- Configuration ---
 BRIDGE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 CHATWOOT_API_URL = os.getenv("CHATWOOT_API_URL")
@@ -631,6 +632,56 @@ async def test_webhook_database_integration(
     print("Webhook database integration test passed")
 
 
+@pytest.mark.asyncio
+async def test_get_or_create_conversation_upserts(async_session: AsyncSession):
+    """The second webhook for a conversation updates its row and keeps the stored Dify ID."""
+    chatwoot_conversation_id = f"upsert-{_generate_random_string()}"
+
+    created = await get_or_create_conversation(
+        async_session,
+        ConversationCreate(chatwoot_conversation_id=chatwoot_conversation_id, dify_conversation_id="dify-upsert"),
+    )
+    assert created.status == "pending"
+    assert created.dify_conversation_id == "dify-upsert"
+
+    # Webhooks carry no Dify ID, so the conflict path must not overwrite it
+    updated = await get_or_create_conversation(
+        async_session,
+        ConversationCreate(chatwoot_conversation_id=chatwoot_conversation_id, status="open", assignee_id=7),
+    )
+    assert updated.id == created.id
+    assert updated.status == "open"
+    assert updated.assignee_id == 7
+    assert updated.dify_conversation_id == "dify-upsert"
+
+    rows = await async_session.execute(
+        select(func.count()).where(Conversation.chatwoot_conversation_id == chatwoot_conversation_id)
+    )
+    assert rows.scalar_one() == 1
+
+
+def test_schema_check_rejects_unmigrated_table(monkeypatch):
+    """A conversation table created before the unique index and timestamp defaults must fail the startup check."""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE conversation (id INTEGER PRIMARY KEY, chatwoot_conversation_id VARCHAR NOT NULL, "
+            "dify_conversation_id VARCHAR, status VARCHAR NOT NULL, assignee_id INTEGER, "
+            "created_at DATETIME NOT NULL, updated_at DATETIME NOT NULL)"
+        )
+        connection.exec_driver_sql(
+            "CREATE INDEX ix_conversation_chatwoot_conversation_id ON conversation (chatwoot_conversation_id)"
+        )
+    monkeypatch.setattr(db_utils, "sync_engine", engine)
+
+    with pytest.raises(RuntimeError, match="alembic upgrade head"):
+        db_utils.create_tables()
+
+    # A table built from the current models passes
+    monkeypatch.setattr(db_utils, "sync_engine", create_engine("sqlite://", poolclass=StaticPool))
+    db_utils.create_tables()
+
+
 @pytest.mark.asyncio
 async def test_concurrent_conversation_processing(async_session: AsyncSession, conversation_factory):
     # This test is out of scope for the current task
@@ -638,6 +689,7 @@ async def test_concurrent_conversation_processing(async_session: AsyncSession, c
 
 
 @pytest.mark.asyncio
+@pytest.mark.chatwoot
 async def test_get_conversation_messages():
     """
     Test that we can retrieve messages from a conversation.
@@ -0,0 +1,234 @@
+from contextlib import contextmanager
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+import redis
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app import config, tasks
+from app.db.base import Base
+from app.db.models import Conversation
+
+CHATWOOT_CONVERSATION_ID = "42"
+
+
+class FakeRedis:
+    """The subset of redis.Redis the tasks use, kept in a dict."""
+
+    def __init__(self):
+        self.data: dict[str, bytes] = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = str(value).encode()
+        return True
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def exists(self, key):
+        return int(key in self.data)
+
+
+@pytest.fixture
+def fake_redis(monkeypatch) -> FakeRedis:
+    client = FakeRedis()
+    monkeypatch.setattr(tasks, "_get_redis", lambda: client)
+    return client
+
+
+@pytest.fixture
+def sync_session(monkeypatch):
+    """Point the task's sync sessions at an in-memory database; yields a session for checking the result."""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+
+    @contextmanager
+    def get_sync_session():
+        with Session(engine) as session:
+            yield session
+            session.commit()
+
+    monkeypatch.setattr(tasks, "get_sync_session", get_sync_session)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+@pytest.fixture
+def stub_dify(monkeypatch) -> AsyncMock:
+    """Replace the Dify client calls the task makes; the answer is never posted to Chatwoot."""
+    dify = AsyncMock()
+    monkeypatch.setattr(tasks.dify, "send_chat_message", dify.send_chat_message)
+    monkeypatch.setattr(tasks.dify, "delete_conversation", dify.delete_conversation)
+    monkeypatch.setattr(tasks, "send_dify_answer", MagicMock())
+    return dify
+
+
+def _store_conversation(session: Session, dify_conversation_id: str) -> None:
+    session.add(
+        Conversation(chatwoot_conversation_id=CHATWOOT_CONVERSATION_ID, dify_conversation_id=dify_conversation_id)
+    )
+    session.commit()
+
+
+def _stored_dify_id(session: Session) -> str:
+    session.expire_all()
+    return session.scalar(
+        select(Conversation.dify_conversation_id).where(
+            Conversation.chatwoot_conversation_id == CHATWOOT_CONVERSATION_ID
+        )
+    )
+
+
+def _not_found() -> httpx.HTTPStatusError:
+    request = httpx.Request("POST", "https://dify.test/v1/chat-messages")
+    return httpx.HTTPStatusError("Not Found", request=request, response=httpx.Response(404, request=request))
+
+
+def _process(dify_conversation_id: str, task_id: str = "task-1", **kwargs):
+    return tasks.process_message_with_dify.apply(
+        args=["Hello", dify_conversation_id, CHATWOOT_CONVERSATION_ID], kwargs=kwargs, task_id=task_id
+    ).get()
+
+
+def test_not_found_conversation_is_replaced(fake_redis, sync_session, stub_dify):
+    """Test that a 404 marks the Dify conversation dead and stores the one started in its place."""
+    _store_conversation(sync_session, "stale")
+    stub_dify.send_chat_message.side_effect = [_not_found(), {"conversation_id": "fresh", "answer": "Hi"}]
+
+    result = _process("stale")
+
+    assert result["conversation_id"] == "fresh"
+    assert [call.kwargs["conversation_id"] for call in stub_dify.send_chat_message.await_args_list] == ["stale", None]
+    assert tasks._is_conversation_dead("stale")
+    assert _stored_dify_id(sync_session) == "fresh"
+    stub_dify.delete_conversation.assert_not_awaited()
+
+
+def test_not_found_conversation_continues_in_stored_replacement(fake_redis, sync_session, stub_dify):
+    """Test that a 404 for a queued message's ID moves to the conversation stored since it was queued."""
+    _store_conversation(sync_session, "winner")
+    stub_dify.send_chat_message.side_effect = [_not_found(), {"conversation_id": "winner", "answer": "Hi"}]
+
+    _process("stale")
+
+    assert [call.kwargs["conversation_id"] for call in stub_dify.send_chat_message.await_args_list] == [
+        "stale",
+        "winner",
+    ]
+    assert _stored_dify_id(sync_session) == "winner"
+
+
+def test_known_dead_conversation_skips_the_doomed_call(fake_redis, sync_session, stub_dify):
+    """Test that a conversation already marked dead goes straight to a new one."""
+    _store_conversation(sync_session, "stale")
+    tasks._mark_conversation_dead("stale")
+    stub_dify.send_chat_message.return_value = {"conversation_id": "fresh", "answer": "Hi"}
+
+    _process("stale")
+
+    stub_dify.send_chat_message.assert_awaited_once()
+    assert stub_dify.send_chat_message.await_args.kwargs["conversation_id"] is None
+    assert _stored_dify_id(sync_session) == "fresh"
+
+
+def test_known_dead_conversation_continues_in_stored_replacement(fake_redis, sync_session, stub_dify):
+    """Test that a replacement another task already stored is used instead of starting a new conversation."""
+    _store_conversation(sync_session, "winner")
+    tasks._mark_conversation_dead("stale")
+    stub_dify.send_chat_message.return_value = {"conversation_id": "winner", "answer": "Hi"}
+
+    _process("stale")
+
+    stub_dify.send_chat_message.assert_awaited_once()
+    assert stub_dify.send_chat_message.await_args.kwargs["conversation_id"] == "winner"
+    assert _stored_dify_id(sync_session) == "winner"
+    stub_dify.delete_conversation.assert_not_awaited()
+
+
+def test_losing_replacement_answers_from_the_winner(fake_redis, sync_session, stub_dify):
+    """Test that a task whose replacement lost the race asks the stored conversation and deletes its own."""
+    _store_conversation(sync_session, "stale")
+    tasks._mark_conversation_dead("stale")
+
+    async def answer(query, inputs, conversation_id=None, **kwargs):
+        if conversation_id is None:
+            # Another queued message stores its replacement while this one is being answered
+            sync_session.execute(update(Conversation).values(dify_conversation_id="winner"))
+            sync_session.commit()
+            return {"conversation_id": "orphan", "answer": "Without history"}
+        return {"conversation_id": conversation_id, "answer": "With history"}
+
+    stub_dify.send_chat_message.side_effect = answer
+
+    result = _process("stale")
+
+    assert result["answer"] == "With history"
+    assert [call.kwargs["conversation_id"] for call in stub_dify.send_chat_message.await_args_list] == [None, "winner"]
+    assert _stored_dify_id(sync_session) == "winner"
+    stub_dify.delete_conversation.assert_awaited_once_with("orphan")
+
+
+def test_first_claim_wins(fake_redis):
+    """Test that the first task to claim a message keeps it across retries and redeliveries."""
+    assert tasks._claim_message(CHATWOOT_CONVERSATION_ID, 7, "task-1")
+    assert tasks._claim_message(CHATWOOT_CONVERSATION_ID, 7, "task-1")
+    assert not tasks._claim_message(CHATWOOT_CONVERSATION_ID, 7, "task-2")
+
+
+def test_duplicate_delivery_is_skipped(fake_redis, stub_dify):
+    """Test that a second task for an already claimed message never reaches Dify."""
+    tasks._claim_message(CHATWOOT_CONVERSATION_ID, 7, "task-1")
+
+    result = _process("existing", task_id="task-2", message_id=7)
+
+    assert result == {"status": "skipped", "reason": "duplicate message"}
+    stub_dify.send_chat_message.assert_not_awaited()
+
+
+def test_claim_fails_open_without_redis(monkeypatch):
+    """Test that the message is processed when Redis is unreachable."""
+    client = MagicMock()
+    client.set.side_effect = redis.ConnectionError("down")
+    monkeypatch.setattr(tasks, "_get_redis", lambda: client)
+
+    assert tasks._claim_message(CHATWOOT_CONVERSATION_ID, 7, "task-1")
+
+
+def test_zero_dedup_ttl_disables_claims(monkeypatch, fake_redis, stub_dify):
+    """Test that MESSAGE_DEDUP_TTL_SECONDS=0 processes every delivery."""
+    monkeypatch.setattr(config, "MESSAGE_DEDUP_TTL_SECONDS", 0)
+    tasks._claim_message(CHATWOOT_CONVERSATION_ID, 7, "task-1")
+    stub_dify.send_chat_message.return_value = {"conversation_id": "existing", "answer": "Hi"}
+
+    result = _process("existing", task_id="task-2", message_id=7)
+
+    assert result["answer"] == "Hi"
+    stub_dify.send_chat_message.assert_awaited_once()
+
+
+def test_error_handover_opens_before_notifying(monkeypatch):
+    """Test that the conversation is opened before the customer is told, and a failed toggle still notifies."""
+    calls = []
+    chatwoot = MagicMock()
+
+    async def toggle_status(**kwargs):
+        calls.append("toggle_status")
+        raise httpx.ConnectError("boom")
+
+    async def send_message(**kwargs):
+        calls.append("send_message")
+        return {"id": 1}
+
+    chatwoot.toggle_status.side_effect = toggle_status
+    chatwoot.send_message.side_effect = send_message
+    monkeypatch.setattr(tasks, "get_chatwoot", lambda: chatwoot)
+
+    tasks.open_conversation_after_error(CHATWOOT_CONVERSATION_ID, "pending", "HTTP error")
+
+    assert calls == ["toggle_status", "send_message"]